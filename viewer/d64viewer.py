@@ -1,7 +1,24 @@
 import sys
 import os
 import argparse
+import itertools
+import bisect
+import mmap
+import math
+import hashlib
+import concurrent.futures
+import functools
+import operator
+import zlib
+import struct
+import json
+import time
+from array import array
 from enum import Enum
+try :
+  import numpy # optional, only makes block_stats() faster
+except ImportError :
+  numpy= None
 
 # http://unusedino.de/ec64/technical/formats/d64.html
 # https://www.manualslib.com/manual/827205/Commodore-1541-Ii.html?page=97#manual
@@ -56,6 +73,11 @@ SECTORSPERTRACK = [ # Number of sectors per track (there is no track 0, so padde
 ]
 
 
+TRACKSTART = [ # Block index of sector 0 of each track (padded like SECTORSPERTRACK)
+  -1 if SECTORSPERTRACK[tix]<0 else sum(SECTORSPERTRACK[1:tix]) for tix in range(len(SECTORSPERTRACK))
+]
+
+
 BASICTOKEN = [                                
   "END"     , # 0x80/128                                                   
   "FOR"     , # 0x81/129                                            
@@ -139,6 +161,63 @@ BASICTOKEN = [
 #PRINTABLE = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~ \t\n\r\x0b\x0c'
 PRINTABLE  = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~ '
 
+
+# PETSCII graphics to Unicode (box drawing, block elements and the "Symbols for Legacy Computing" block U+1FB00)
+PETSCIIGRAPHA0 = ( # 0xA0..0xBF, same in both charsets except A9 and BA; 0xE0..0xFE repeat these
+  "\u00a0\u258c\u2584\u2594\u2581\u258f\u2592\u2595"           # A0-A7 ▌▄▔▁▏▒▕
+  "\U0001fb8f\u25e4\U0001fb87\u251c\u2597\u2514\u2510\u2582"   # A8-AF 🮏◤🮇├▗└┐▂
+  "\u250c\u2534\u252c\u2524\u258e\u258d\U0001fb88\U0001fb82"   # B0-B7 ┌┴┬┤▎▍🮈🮂
+  "\U0001fb83\u2583\U0001fb7f\u2596\u259d\u2518\u2598\u259a"   # B8-BF 🮃▃🮿▖▝┘▘▚
+)
+PETSCIIGRAPHC0 = ( # 0xC0..0xDF in the upper/graphics charset; 0x60..0x7F repeat these
+  "\u2500\u2660\U0001fb72\U0001fb78\U0001fb77\U0001fb76\U0001fb7a\U0001fb71" # C0-C7 ─♠🭲🭸🭷🭶🭺🭱
+  "\U0001fb74\u256e\u2570\u256f\U0001fb7c\u2572\u2571\U0001fb7d"   # C8-CF 🭴╮╰╯🭼╲╱🭽
+  "\U0001fb7e\u25cf\U0001fb7b\u2665\U0001fb70\u256d\u2573\u25cb"   # D0-D7 🭾●🭻♥🭰╭╳○
+  "\u2663\U0001fb75\u2666\u253c\U0001fb8c\u2502\u03c0\u25e5"       # D8-DF ♣🭵♦┼🮌│π◥
+)
+
+
+OPCODES = [ # 6502 instruction per opcode byte: "mnemonic mode"; undocumented opcodes are marked with *
+  # x0        x1         x2         x3         x4         x5         x6         x7         x8         x9         xA         xB         xC         xD         xE         xF
+  "BRK imp","ORA izx","*JAM imp","*SLO izx","*NOP zp" ,"ORA zp" ,"ASL zp" ,"*SLO zp" ,"PHP imp","ORA imm","ASL acc","*ANC imm","*NOP abs","ORA abs","ASL abs","*SLO abs", # 0x
+  "BPL rel","ORA izy","*JAM imp","*SLO izy","*NOP zpx","ORA zpx","ASL zpx","*SLO zpx","CLC imp","ORA aby","*NOP imp","*SLO aby","*NOP abx","ORA abx","ASL abx","*SLO abx", # 1x
+  "JSR abs","AND izx","*JAM imp","*RLA izx","BIT zp" ,"AND zp" ,"ROL zp" ,"*RLA zp" ,"PLP imp","AND imm","ROL acc","*ANC imm","BIT abs" ,"AND abs","ROL abs","*RLA abs", # 2x
+  "BMI rel","AND izy","*JAM imp","*RLA izy","*NOP zpx","AND zpx","ROL zpx","*RLA zpx","SEC imp","AND aby","*NOP imp","*RLA aby","*NOP abx","AND abx","ROL abx","*RLA abx", # 3x
+  "RTI imp","EOR izx","*JAM imp","*SRE izx","*NOP zp" ,"EOR zp" ,"LSR zp" ,"*SRE zp" ,"PHA imp","EOR imm","LSR acc","*ALR imm","JMP abs" ,"EOR abs","LSR abs","*SRE abs", # 4x
+  "BVC rel","EOR izy","*JAM imp","*SRE izy","*NOP zpx","EOR zpx","LSR zpx","*SRE zpx","CLI imp","EOR aby","*NOP imp","*SRE aby","*NOP abx","EOR abx","LSR abx","*SRE abx", # 5x
+  "RTS imp","ADC izx","*JAM imp","*RRA izx","*NOP zp" ,"ADC zp" ,"ROR zp" ,"*RRA zp" ,"PLA imp","ADC imm","ROR acc","*ARR imm","JMP ind" ,"ADC abs","ROR abs","*RRA abs", # 6x
+  "BVS rel","ADC izy","*JAM imp","*RRA izy","*NOP zpx","ADC zpx","ROR zpx","*RRA zpx","SEI imp","ADC aby","*NOP imp","*RRA aby","*NOP abx","ADC abx","ROR abx","*RRA abx", # 7x
+  "*NOP imm","STA izx","*NOP imm","*SAX izx","STY zp" ,"STA zp" ,"STX zp" ,"*SAX zp" ,"DEY imp","*NOP imm","TXA imp","*ANE imm","STY abs","STA abs","STX abs","*SAX abs", # 8x
+  "BCC rel","STA izy","*JAM imp","*SHA izy","STY zpx","STA zpx","STX zpy","*SAX zpy","TYA imp","STA aby","TXS imp","*TAS aby","*SHY abx","STA abx","*SHX aby","*SHA aby", # 9x
+  "LDY imm","LDA izx","LDX imm","*LAX izx","LDY zp" ,"LDA zp" ,"LDX zp" ,"*LAX zp" ,"TAY imp","LDA imm","TAX imp","*LXA imm","LDY abs","LDA abs","LDX abs","*LAX abs", # Ax
+  "BCS rel","LDA izy","*JAM imp","*LAX izy","LDY zpx","LDA zpx","LDX zpy","*LAX zpy","CLV imp","LDA aby","TSX imp","*LAS aby","LDY abx","LDA abx","LDX aby","*LAX aby", # Bx
+  "CPY imm","CMP izx","*NOP imm","*DCP izx","CPY zp" ,"CMP zp" ,"DEC zp" ,"*DCP zp" ,"INY imp","CMP imm","DEX imp","*SBX imm","CPY abs","CMP abs","DEC abs","*DCP abs", # Cx
+  "BNE rel","CMP izy","*JAM imp","*DCP izy","*NOP zpx","CMP zpx","DEC zpx","*DCP zpx","CLD imp","CMP aby","*NOP imp","*DCP aby","*NOP abx","CMP abx","DEC abx","*DCP abx", # Dx
+  "CPX imm","SBC izx","*NOP imm","*ISC izx","CPX zp" ,"SBC zp" ,"INC zp" ,"*ISC zp" ,"INX imp","SBC imm","NOP imp","*SBC imm","CPX abs","SBC abs","INC abs","*ISC abs", # Ex
+  "BEQ rel","SBC izy","*JAM imp","*ISC izy","*NOP zpx","SBC zpx","INC zpx","*ISC zpx","SED imp","SBC aby","*NOP imp","*ISC aby","*NOP abx","SBC abx","INC abx","*ISC abx", # Fx
+]
+
+
+ADDRMODES = { # 6502 addressing mode: (number of operand bytes, operand format)
+  "imp" : (0, ""           ), # implied
+  "acc" : (0, "A"          ), # accumulator
+  "imm" : (1, "#${0:02X}"  ), # immediate
+  "zp"  : (1, "${0:02X}"   ), # zero page
+  "zpx" : (1, "${0:02X},X" ), # zero page indexed with X
+  "zpy" : (1, "${0:02X},Y" ), # zero page indexed with Y
+  "izx" : (1, "(${0:02X},X)"), # indexed indirect
+  "izy" : (1, "(${0:02X}),Y"), # indirect indexed
+  "abs" : (2, "${0:04X}"   ), # absolute
+  "abx" : (2, "${0:04X},X" ), # absolute indexed with X
+  "aby" : (2, "${0:04X},Y" ), # absolute indexed with Y
+  "ind" : (2, "(${0:04X})" ), # indirect (JMP only)
+  "rel" : (1, "${0:04X}"   ), # relative (branches); shown as target address
+}
+
+
+# Precomputed per opcode byte: (mnemonic, number of operand bytes, operand format, is documented, is relative)
+DISASM = [ ( op.split()[0], *ADDRMODES[op.split()[1]], op[0]!='*', op.split()[1]=="rel" ) for op in OPCODES ]
+
 #endregion
 #region ### HELP ####################################################################
 
@@ -146,8 +225,10 @@ PRINTABLE  = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!"#$
 def help_hex() :
   print("Hex layout")
   print("- 16 rows of 16 bytes")
-  print("- each row shows offset, 16 bytes in hex, 16 bytes as ASCII")
-  print("- non-printable ASCII printed as · (and 00 as °)")
+  print("- each row shows offset, 16 bytes in hex, 16 bytes as PETSCII")
+  print("- PETSCII uses the upper/graphics charset, --mcharset selects lower/upper or ascii-only")
+  print("- control codes printed as · (and 00 as °)")
+  print("- glyphs the output encoding lacks (e.g. graphics on a redirected Windows console) print as ?")
   print("- hex between ** denotes bytes in block past end-of-file")
 
 
@@ -191,6 +272,11 @@ def help_disk() :
   print("- dir: same as DIR but empty (zeros)")
   print("- FIL: file data (any type)")
   print("- ---: same as FIL but empty (zeros)")
+  print("- ERR: block could not be decoded (G64 only; see --tblock for the error)")
+  print("With --mheat a block shows its entropy (shade, 0..8 bits per byte) and class (letter)")
+  print("- . empty, f fill (one byte value in 3/4 of the block), t text (3/4 PETSCII text)")
+  print(f"- z compressed (entropy {STATSCOMPRESSED} or more), c code (anything else, also tokenized basic)")
+  print(f"- statistics are computed for all blocks at once{'' if numpy!=None else ' (install numpy to make that faster)'}; --format json exports them")
   print("The 35 tracks have varying amount of sectors")
   print("- tracks  1..17 (zone 0) have 21 sectors")
   print("- tracks 18..24 (zone 1) have 19 sectors")
@@ -202,6 +288,122 @@ def help_disk() :
   print("- 0..682 for blocks")
 
 
+def help_asm() :
+  print("Disassembly notes")
+  print("- first two bytes of a PRG file are the load address, first instruction is at that address")
+  print("- each row shows address, offset in disk block, instruction bytes, and 6502 instruction")
+  print("- operands are hex; branch operands are shown as target address")
+  print("- .byte rows are data, not instructions")
+  print("  - BASIC at 0801 (e.g. 10 SYS2061) and bytes up to the SYS address")
+  print("  - undocumented opcodes (unless --mtech; then shown with * prefix)")
+  print("- instructions may straddle two disk blocks (row is shown in the block where it starts)")
+
+
+def help_load() :
+  print("Load time notes")
+  print(f"- a 1541 disk spins at {RPM} rpm, so one revolution takes {60/RPM*1000:.0f} ms")
+  print("- a sector passes the head in 1/n of a revolution, n is the number of sectors of the track (17..21)")
+  print(f"- after reading a block, drive and C64 need time to process it (--mproc, default {BLOCKPROCESSTIME*1000:.0f} ms)")
+  print("  the next block should be some sectors further (skip), so that it arrives just after processing")
+  print("  when it is too close, a nearly complete revolution is lost (revs counts those)")
+  print(f"- moving the head one track costs {STEPTIME*1000:.0f} ms")
+  print("- ideal is the time with every block at the best skip on the same tracks")
+  print(f"- SLOW flags files that take more than {SLOWRATIO}x their ideal time (badly interleaved)")
+  print("- --mtech shows the estimate per block (for --tload with a filename)")
+
+
+def help_frag() :
+  print("Fragmentation notes")
+  print("- tracks is the number of tracks the file uses, changes is the number of track changes in the chain")
+  print("- jumps counts track changes that skip tracks or reverse direction")
+  print("- frag is the fragmentation score: unneeded track changes plus jumps, per block (0% is contiguous)")
+  print(f"  F flags files with frag above {FRAGRATIO}%")
+  print("- interleave is ideal load time as percentage of estimated load time (see --tload)")
+  print("  S flags files that are badly interleaved")
+  print("- --arelayout writes a new disk: same directory and BAM header, but all blocks reallocated")
+  print("  (each file contiguous, at the best skip per track), the file contents are verified by SHA-1")
+
+
+def help_lost() :
+  print("Recovery notes")
+  print("- live blocks are the BAM, the directory chain, and the chains (and REL side sectors) of all non-DEL entries")
+  print("- all t/s-links are read once into a successor/predecessor graph")
+  print("- candidates are scratched directory entries (type DEL, but with a name and a first block),")
+  print("  and orphan chain heads: non-live blocks no other block links to, not empty and not as the 1541 formats them (4B 01 01 ..);")
+  print("  a lone orphan block with an invalid link is skipped")
+  print("- a candidate chain follows the t/s-links until the last block (ok), a broken link, a loop, a live block,")
+  print("  or a block claimed by an earlier candidate (scratched entries first), so no block is extracted twice")
+  print("- score ranks plausibility (0..100): proper chain end 40 (partial 10), load address 15, basic program 15,")
+  print("  scratched entry 15, entry size matches chain 10, more than one block 5")
+  print("- --tlost rank shows one candidate like a file (hex, basic, asm view); --msave dir extracts all candidates")
+
+
+def help_similar() :
+  print("Similarity notes")
+  print("- all images passed are compared (directories are searched for .d64, .g64 and .d64m files)")
+  print("- an image is the set of its non-empty blocks, each block fingerprinted together with its position")
+  print("- similarity is the Jaccard index of two such sets: blocks equal in both, out of blocks used in either")
+  print(f"- each image gets a MinHash signature of {MINHASHBINS} values (one hash function, binned, empty bins densified)")
+  print(f"- signatures are split in {LSHBANDS} bands; images sharing a band are compared, and clustered when similar enough")
+  print("- per cluster the first image is the reference; similar and differing blocks are exact (images are re-read)")
+
+
+def help_store() :
+  print("Store notes")
+  print(f"- a store is a directory with {STOREDATA} (every distinct block once) and {STOREINDEX} (sha1 of each of those blocks)")
+  print("- blocks are identified by content, so empty blocks and blocks shared with other images are stored once")
+  print("- per image a .d64m manifest lists the store index of each of its 683 blocks (2738 bytes instead of 174848)")
+  print("- packing more images only appends to the store; a manifest packed again is overwritten")
+  print("- every view works on a manifest: it reads only the blocks of that image from the store (no unpack needed)")
+  print("- directories are packed with their subdirectories; --aunpack recreates the same tree of .d64 files")
+  print("- G64 images are packed decoded; their decode errors are not kept")
+
+
+def help_geos() :
+  print("GEOS notes")
+  print("- a GEOS disk has the signature 'GEOS format' in the BAM at offset AD")
+  print("- a GEOS file uses unused bytes of its directory entry: 15-16 t/s of the info block, 17 structure (00 SEQ, 01 VLIR),")
+  print("  18 GEOS file type, 19-1D date; --tdir --mtech shows these in the unused column")
+  print("- the info block has the icon, load/end/start address, class, author, parent application and description")
+  print("- a VLIR file starts with a record index block (link 00 FF): up to 127 t/s, one per record (00/FF is empty, 00/00 ends)")
+  print("- every record is a chain of its own; other views only see the index block as a 1 block file")
+  print("- --mrecord N jumps to the chain of record N via the index, and views it like a file (hex, basic, asm, --msave)")
+  print("- --msave dir (without --mrecord) writes info.bin and record-NNN.bin for all records, in one pass over the index")
+
+
+def help_integrity() :
+  print("Integrity notes")
+  print("- --amanifest writes one json line per image: path relative to the manifest, size, sha256 of the image, and per block")
+  print("  a blake2b-64 hash; the position in that list is the block index (track/sector follow from the 1541 layout)")
+  print("- hashes are over the 683 blocks as the viewer sees them: a G64 is decoded, a .d64m is read from its store")
+  print("- --averify hashes the images again, in a pool of threads; a d64 is mapped and hashed in one call, which releases the GIL")
+  print("- only when the image hash differs, the blocks are hashed to find the damaged ones, and the directory is")
+  print("  followed to name the BAM, directory or files each damaged block belongs to")
+  print("- images not in the manifest are NEW, manifest entries not found are MISSING; any damage makes the exit status 1")
+  print("- --format json/ndjson gives a record per image (also the ok ones, with their status) and a summary record")
+
+
+def help_mem() :
+  print("Memory map notes")
+  print("- one directory pass: per PRG the load address (first two bytes) and the length (from the block links)")
+  print("- the interval index has a segment between every two successive load/end addresses, with the files covering it")
+  print("- a segment with no file between the first load and the last end is a hole, one with several files an overlap")
+  print("- overlaps counts the files sharing at least one address; over a collection files of all images are compared")
+  print("- areas: zero page 0000, stack 0100, OS work 0200, screen 0400, BASIC 0800, BASIC ROM A000, RAM C000, IO D000, KERNAL ROM E000")
+  print("- ! marks a conflict: system areas, RAM under ROM (needs banking), IO registers, and BASIC for files not loading at 0801")
+
+
+def help_xref() :
+  print("Cross-reference notes")
+  print("- one pass over the basic lines builds the line index (line number to address, block and offset)")
+  print("  and the cross-reference; both are cached on the program content")
+  print("- targets are line numbers after GOTO, GOSUB, THEN, RUN, LIST and GO TO (ON x GOTO lists included);")
+  print("  UNDEFINED marks targets that are not a line of the program")
+  print("- variables are named as the C64 sees them: two significant characters, $ or %, and ( for arrays")
+  print("- strings, REM and DATA are skipped")
+  print("- --mlines from-to with --vbasic uses the line index to start rendering at the block of line from")
+
+
 def help_basic() :
   print("- as for every block, first two bytes link to next block")
   print("- first block of a basic program has load address at offset 02 and 03")
@@ -220,10 +422,53 @@ CHAR00      = "°" # "¶"
 CHARNOGLYPH = "·"
 
 
-def makeprintable(ch) :
-  if ch in PRINTABLE : return ch
-  elif ch==chr(0) : return CHAR00
-  else: return CHARNOGLYPH
+# Returns the 256 entry PETSCII to Unicode table (list of str) for `charset` ("upper", "lower" or "ascii")
+# Control codes map to CHARNOGLYPH (0x00 to CHAR00); "ascii" is the classic view: only printable ascii is shown
+def petscii_table(charset) :
+  table= [CHARNOGLYPH]*256
+  table[0x00]= CHAR00
+  if charset=="ascii" :
+    for ch in PRINTABLE : table[ord(ch)]= ch
+    return table
+  for b in range(0x20,0x5B) : table[b]= chr(b)
+  table[0x5B:0x60]= "[£]↑←"
+  graphA0= PETSCIIGRAPHA0
+  graphC0= PETSCIIGRAPHC0
+  if charset=="lower" :
+    for b in range(0x41,0x5B) : table[b]= chr(b).lower()
+    graphA0= graphA0[:0x09]+"\U0001fb99"+graphA0[0x0A:0x1A]+"\u2713"+graphA0[0x1B:]  # A9 🮙, BA ✓
+    graphC0= graphC0[:1]+"ABCDEFGHIJKLMNOPQRSTUVWXYZ"+graphC0[0x1B:0x1E]+"\U0001fb96\U0001fb98" # DE 🮖, DF 🮘
+  table[0x60:0x80]= graphC0
+  table[0xA0:0xC0]= graphA0
+  table[0xC0:0xE0]= graphC0
+  table[0xE0:0xFF]= graphA0[:0x1F]
+  table[0xFF]= graphC0[0x1E] # 0xFF repeats 0xDE (pi in upper/graphics)
+  return table
+
+
+PETSCII = { charset:petscii_table(charset) for charset in ("upper","lower","ascii") }
+petscii= None      # table used for rendering, see set_charset()
+petsciibasic= None # same, but with BASIC tokens for 0x80..0xCB
+
+
+# Selects the charset used for all text rendering
+def set_charset(charset) :
+  global petscii, petsciibasic
+  petscii= PETSCII[charset]
+  petsciibasic= petscii[:0x80] + BASICTOKEN + petscii[0x80+len(BASICTOKEN):]
+
+set_charset("upper")
+
+
+# Lets `stream` print a ? for characters its encoding lacks, instead of raising UnicodeEncodeError halfway a view.
+# The upper and lower charsets use block graphics that e.g. a cp1252 stdout (redirected on Windows) can not encode.
+def set_replace(stream) :
+  if hasattr(stream,"reconfigure") : stream.reconfigure(errors="replace")
+
+
+# Converts PETSCII bytes to a (printable) str, all bytes in one go
+def petscii2str(data) :
+  return bytes(data).decode("latin-1").translate(petscii)
 
 
 def filetype2str(filetype) :
@@ -245,11 +490,7 @@ def filetype2str(filetype) :
 
 
 def filename2str(filename):
-  str= ""
-  for d in filename:
-    if d==160 : break
-    str += makeprintable(chr(d))
-  return str
+  return petscii2str( bytes(filename).partition(b"\xA0")[0] ) # 160 (shifted space) pads the name
 
 
 def bin2str(binarray) :
@@ -257,12 +498,11 @@ def bin2str(binarray) :
 
 
 def token(byte) :
-  if 128<=byte and byte<=203: return BASICTOKEN[byte-128]
-  return makeprintable(chr(byte))
+  return petsciibasic[byte]
 
 
 def bin2bas(binarray) :
-  return ''.join( [f"{token(bin)}" for bin in binarray] )
+  return bytes(binarray).decode("latin-1").translate(petsciibasic)
 
 
 #endregion
@@ -386,6 +626,7 @@ class BasicLineIter :
     remainingbytes= BYTESPERBLOCK - self.offset
     if remainingbytes<2 :
       # can't compute addrnextline, push out to next
+      addrnextline= 0 # link is split over the block boundary: unknown here, so the sanity check below is skipped
       prvdata= b""
       curdata= b""
       nxtdata= self.block.data[self.offset:] # WARNING nxtdata could be []
@@ -417,6 +658,347 @@ class BasicLineIter :
     return tuple
 
 
+# Generates (addr,nextaddr,linenum,text) for the basic lines in `data` (file content, starting with the load address).
+# Follows the line links like the C64 does; stops at the 00 00 end marker, at the end of `data`, or at a link that does not point forward.
+def basic_lines(data) :
+  if len(data)<2 : return
+  addr= data[0]+256*data[1]
+  pos= 2
+  while pos+4<=len(data) :
+    nextaddr= data[pos]+256*data[pos+1]
+    if nextaddr==0 : return
+    linenum= data[pos+2]+256*data[pos+3]
+    end= data.find(0,pos+4)
+    if end<0 : end= len(data)
+    yield (addr,nextaddr,linenum,data[pos+4:end])
+    if nextaddr<=addr : return
+    pos+= nextaddr-addr
+    addr= nextaddr
+
+
+# Tokens that are followed by a line number (ON x GOTO/GOSUB have a list), see basic_xref
+BASICJUMPS = { 0x89:"GOTO", 0x8D:"GOSUB", 0xA7:"THEN", 0x8A:"RUN", 0x9B:"LIST", 0xCB:"GO TO" }
+
+
+# Scans `text` (tokenized basic line `linenum`, without link, line number and terminating 00) and adds 
+# jump targets to `targets` (target -> list of (linenum,keyword)) and variable uses to `variables` (name -> list of linenum).
+# Strings are skipped, REM ends the scan, DATA is skipped up to the next ':'. Variable names are normalized 
+# the way the C64 sees them: two significant characters, plus $ or %, plus ( for arrays.
+def basic_xref(linenum,text,targets,variables) :
+  n= len(text)
+  i= 0
+  while i<n :
+    b= text[i]
+    if b==0x22 : # string
+      end= text.find(b'"',i+1)
+      i= n if end<0 else end+1
+    elif b==0x8F : # REM
+      break
+    elif b==0x83 : # DATA
+      while i<n and text[i]!=0x3A :
+        if text[i]==0x22 : 
+          end= text.find(b'"',i+1)
+          i= n if end<0 else end
+        i+= 1
+    elif b in BASICJUMPS :
+      keyword= BASICJUMPS[b]
+      i+= 1
+      if b==0xCB : # GO TO
+        while i<n and text[i]==0x20 : i+= 1
+        if i==n or text[i]!=0xA4 : continue
+        i+= 1
+      while True : # a target, or a list of targets (ON x GOTO)
+        while i<n and text[i]==0x20 : i+= 1
+        start= i
+        while i<n and 0x30<=text[i]<=0x39 : i+= 1
+        if i==start : break
+        targets.setdefault(int(text[start:i]),[]).append( (linenum,keyword) )
+        while i<n and text[i]==0x20 : i+= 1
+        if i==n or text[i]!=0x2C : break
+        i+= 1
+    elif 0x41<=b<=0x5A : # variable name: letters and digits, then $ or %, then ( for an array
+      start= i
+      while i<n and (0x41<=text[i]<=0x5A or 0x30<=text[i]<=0x39) : i+= 1
+      name= text[start:min(i,start+2)].decode("latin-1")
+      if i<n and text[i] in (0x24,0x25) : 
+        name+= chr(text[i])
+        i+= 1
+      if i<n and text[i]==0x28 : name+= "("
+      uses= variables.setdefault(name,[])
+      if len(uses)==0 or uses[-1]!=linenum : uses.append(linenum)
+    elif 0x30<=b<=0x39 or b==0x2E : # number, possibly with exponent (so E is not a variable)
+      while i<n and (0x30<=text[i]<=0x39 or text[i]==0x2E) : i+= 1
+      if i<n and text[i]==0x45 :
+        i+= 1
+        if i<n and text[i] in (0x2B,0x2D,0xAA,0xAB) : i+= 1 # + - (also as tokens)
+    else :
+      i+= 1
+
+
+# Line index and cross-reference of a basic program, built in one pass over its lines.
+# lines holds (linenum,addr,bix,offset) per line, in program order: the block and offset where the line starts.
+class BasicIndex :
+
+  def __init__(self,chain) :
+    self.chain= chain # the blocks of the program
+    self.data= chain2bin(chain)
+    self.load= self.data[0]+256*self.data[1] if len(self.data)>=2 else 0
+    self.lines= []
+    self.targets= {}
+    self.variables= {}
+    for (addr,nextaddr,linenum,text) in basic_lines(self.data) :
+      pos= addr-self.load+2 # position in data
+      block= chain[pos//(BYTESPERBLOCK-2)]
+      self.lines.append( (linenum,addr,block.bix,2+pos%(BYTESPERBLOCK-2)) )
+      basic_xref(linenum,text,self.targets,self.variables)
+    self.linenums= [line[0] for line in self.lines]
+
+  # Returns the lines (see self.lines) with line number in lo..hi (either may be None)
+  def find(self,lo=None,hi=None) :
+    if self.linenums==sorted(self.linenums) : # normal program: bisect
+      start= 0 if lo==None else bisect.bisect_left(self.linenums,lo)
+      end= len(self.linenums) if hi==None else bisect.bisect_right(self.linenums,hi)
+      return self.lines[start:end]
+    return [line for line in self.lines if (lo==None or line[0]>=lo) and (hi==None or line[0]<=hi)]
+
+  # Returns (k,addr,prvdata,nexts) to render lines lo..hi with Block.print_filebasic: start at block chain[k], 
+  # whose first data byte has `addr`, with `prvdata` the part of a line started in block k-1, and continue `nexts` blocks.
+  # Returns None when no line is in range.
+  def blockspan(self,lo=None,hi=None) :
+    lines= self.find(lo,hi)
+    if len(lines)==0 : return None
+    size= BYTESPERBLOCK-2
+    k= (lines[0][1]-self.load+2)//size
+    last= self.linenums.index(lines[-1][0]) # end of the last line is the start of the line after it (or end of data)
+    end= self.lines[last+1][1]-self.load+2 if last+1<len(self.lines) else len(self.data)
+    nexts= min(len(self.chain)-1,max(k,(end-1)//size)) - k
+    if k==0 : return (0,None,b"",nexts)
+    boundary= k*size
+    prvstart= boundary
+    for (linenum,addr,bix,offset) in self.lines :
+      pos= addr-self.load+2
+      if pos>=boundary : break
+      nextpos= pos+ (self.data[pos]+256*self.data[pos+1]-addr if pos+1<len(self.data) else 0)
+      if nextpos>boundary or boundary-pos<2 : prvstart= pos
+    return (k,self.load+boundary-2,self.data[prvstart:boundary],nexts)
+
+
+BASICINDEXCACHE= {} # (bix of first block, sha1 of its chain) -> BasicIndex, only for the last program indexed
+
+
+# Returns the BasicIndex of the program starting at `block1`; cached on program content (e.g. for --mwatch)
+def basic_index(block1) :
+  chain= [block for nexts,block in block1.chain()]
+  sha1= hashlib.sha1()
+  for block in chain : sha1.update(block.data) # includes the t/s-links, so the blocks of each line are the same
+  key= (block1.bix,sha1.digest())
+  if key not in BASICINDEXCACHE : 
+    BASICINDEXCACHE.clear() # one program is viewed at a time; with --mwatch every edit would add an entry
+    BASICINDEXCACHE[key]= BasicIndex(chain)
+  return BASICINDEXCACHE[key]
+
+
+# Generates the cross-reference report of BasicIndex `index`: jump targets and variable uses
+def gen_xrefhuman(index,with_header=True) :
+  linesep= "|--------|----------------------------------------------------------------------------|"
+  defined= set(index.linenums)
+  if with_header :
+    yield "| target | referenced from                                                            |"
+    yield linesep
+  for target in sorted(index.targets) :
+    refs= ', '.join( f"{linenum} {keyword}" for linenum,keyword in index.targets[target] )
+    flag= "" if target in defined else " (UNDEFINED)"
+    yield f"| {target:6} | {refs+flag:<74} |"
+  if with_header :
+    yield linesep
+    yield "| var    | used in lines                                                              |"
+    yield linesep
+  for name in sorted(index.variables) :
+    yield f"| {name:<6} | {', '.join(map(str,index.variables[name])):<74} |"
+  if with_header : yield linesep
+  undefined= len([target for target in index.targets if target not in defined])
+  yield f"{len(index.lines)} lines, {len(index.targets)} jump targets ({undefined} undefined), {len(index.variables)} variables"
+
+
+# Generates the cross-reference records of BasicIndex `index`
+def gen_xrefrecords(index) :
+  defined= set(index.linenums)
+  for target in sorted(index.targets) :
+    yield {'record':"target", 'line':target, 'defined':target in defined, 'from':[ {'line':linenum,'keyword':keyword} for linenum,keyword in index.targets[target] ]}
+  for name in sorted(index.variables) :
+    yield {'record':"variable", 'name':name, 'lines':index.variables[name]}
+
+
+#endregion
+#region ### BASIC TOKENIZER #########################################################
+
+
+# Trie over the basic keywords: a dict per character, key "" holds the token of the keyword ending there.
+# "?" is the PRINT shorthand, like on the C64.
+def basic_trie() :
+  trie= {}
+  for tok,keyword in itertools.chain(enumerate(BASICTOKEN,0x80),[(0x99,"?")]) :
+    node= trie
+    for ch in keyword : node= node.setdefault(ch,{})
+    node[""]= tok
+  return trie
+
+BASICTRIE= basic_trie()
+
+
+# Inverse of a petscii table (char to byte). Graphics occur twice in a table; the copies at 60..7F and 
+# E0..FF win, so that no char ends up as a byte in the token range 80..CB.
+def petscii_inverse(table) :
+  inverse= {}
+  for b in itertools.chain(range(0x01,0x80),range(0xE0,0x100),range(0xA0,0xE0)) :
+    if table[b]!=CHARNOGLYPH : inverse.setdefault(table[b],b)
+  return inverse
+
+
+# Tokenizes `text` (one basic line, without line number) to bytes. Keywords are matched case insensitive 
+# with longest match; nothing is tokenized in strings, after REM, and after DATA up to the next ':'.
+# Each char is looked at by the trie at most len("RESTORE") times, so this is linear in len(text).
+def basic_crunch(text,inverse) :
+  def tobyte(ch) :
+    b= inverse.get(ch)
+    if b==None : b= inverse.get(ch.upper())
+    if b==None : raise ValueError(f"character {ch!r} has no PETSCII code in this charset")
+    return b
+  out= bytearray()
+  (i,n)= (0,len(text))
+  (quote,data)= (False,False)
+  while i<n :
+    ch= text[i]
+    if not quote and not data :
+      (node,j,tok,end)= (BASICTRIE,i,None,i)
+      while j<n :
+        node= node.get(text[j].upper())
+        if node==None : break
+        j+= 1
+        if "" in node : (tok,end)= (node[""],j)
+      if tok!=None :
+        out.append(tok)
+        i= end
+        if tok==0x8F : # REM: rest of line as is
+          out+= bytes( tobyte(ch) for ch in text[i:] )
+          break
+        data= tok==0x83
+        continue
+    out.append(tobyte(ch))
+    if ch=='"' : quote= not quote
+    elif ch==':' and not quote : data= False
+    i+= 1
+  return bytes(out)
+
+
+# Tokenizes a basic listing (lines "<linenum> <text>", in ascending order) to a prg: load address, 
+# then per line the address of the next line, the line number, the tokenized text and 00; then 00 00.
+# Text is mapped with the charset selected by set_charset().
+def bas2bin(listing,load=0x0801) :
+  inverse= petscii_inverse(petscii)
+  prg= bytearray( struct.pack("<H",load) )
+  (addr,prvnum)= (load,-1)
+  for lix,line in enumerate(listing.splitlines(),1) :
+    line= line.lstrip(" ")
+    if line=="" : continue
+    ndigits= len(line)-len(line.lstrip("0123456789"))
+    if ndigits==0 or int(line[:ndigits])>63999 : raise ValueError(f"line {lix}: does not start with a line number 0..63999")
+    linenum= int(line[:ndigits])
+    if linenum<=prvnum : raise ValueError(f"line {lix}: line number {linenum} does not follow {prvnum}")
+    try :
+      text= basic_crunch(line[ndigits:].lstrip(" "),inverse)
+    except ValueError as e :
+      raise ValueError(f"line {lix}: {e}") from None
+    nextaddr= addr+4+len(text)+1
+    if nextaddr>0xFFFF : raise ValueError(f"line {lix}: program does not fit in memory")
+    prg+= struct.pack("<HH",nextaddr,linenum) + text + b"\0"
+    (addr,prvnum)= (nextaddr,linenum)
+  prg+= b"\0\0"
+  return bytes(prg)
+
+
+# Lists a tokenized prg the way the basic view shows it (one "<linenum> <text>" per line), the inverse of bas2bin
+def bin2listing(prg) :
+  return "\n".join( f"{linenum} {bin2bas(text)}" for (addr,nextaddr,linenum,text) in basic_lines(prg) )
+
+
+#endregion
+#region ### DISASSEMBLER ############################################################
+
+
+# Returns the SYS address in the BASIC line(s) at the start of PRG `data` (which starts with the load address), or None
+# Also returns the address just past the BASIC program (past its 00 00 end marker), or None if data does not hold BASIC
+def basic_sys(data) :
+  if len(data)<4 or data[0]+256*data[1]!=0x0801 : return (None,None)
+  sysaddr= None
+  addr= 0x0801
+  pos= 2
+  while pos+2<=len(data) :
+    nextaddr= data[pos]+256*data[pos+1]
+    if nextaddr==0 : return (sysaddr,addr+2)
+    if nextaddr<=addr+4 or pos+nextaddr-addr>len(data) : return (None,None) # does not look like BASIC
+    line= data[pos+4:pos+nextaddr-addr-1]
+    ix= line.find(0x9E) # SYS token
+    if sysaddr==None and ix>=0 :
+      digits= line[ix+1:].lstrip(b" (").split(b":")[0]
+      num= b""
+      for d in digits :
+        if not 0x30<=d<=0x39 : break
+        num+= bytes([d])
+      if len(num)>0 : sysaddr= int(num)
+    pos+= nextaddr-addr
+    addr= nextaddr
+  return (None,None)
+
+
+# Returns the address ranges (start,end) with end exclusive, of PRG `data` that are data, not code. 
+# This detects the BASIC program that starts most machine code files ("10 SYS2061").
+# The BASIC part, and anything between it and the SYS address, is data; a BASIC program without SYS is data all over.
+def data_ranges(data) :
+  (sysaddr,basicend)= basic_sys(data)
+  if basicend==None : return []
+  load= data[0]+256*data[1]
+  if sysaddr==None or sysaddr<basicend : return [(load,load+len(data)-2)]
+  return [(load,sysaddr)]
+
+
+# Generator that disassembles PRG `data` (which starts with the load address).
+# Yields (addr,pos,size,text): address, index in `data`, number of bytes, and disassembly of one instruction or data row.
+# Bytes in `dataranges`, and undocumented opcodes (unless `with_illegal`), are rendered as .byte rows (at most 8 bytes).
+# A row never runs past an address in `breaks` (e.g. block boundaries).
+def disassemble(data,dataranges=(),with_illegal=False,breaks=()) :
+  load= data[0]+256*data[1]
+  isdata= bytearray(len(data)) # 1 for bytes that are data, indexed by position in `data`
+  for (start,end) in dataranges :
+    start= max(start-load+2,2)
+    end= min(end-load+2,len(data))
+    if start<end : isdata[start:end]= b"\x01"*(end-start)
+  isbreak= bytearray(len(data)+1)
+  for addr in breaks :
+    if 2<=addr-load+2<len(data) : isbreak[addr-load+2]= 1
+  table= DISASM
+  pos= 2
+  while pos<len(data) :
+    op= data[pos]
+    (mnem,num,fmt,legal,rel)= table[op]
+    size= 1+num
+    if not isdata[pos] and (legal or with_illegal) and pos+size<=len(data) and not any(isdata[pos+1:pos+size]) :
+      addr= load+pos-2
+      if num==0 : text= f"{mnem} {fmt}".rstrip()
+      elif rel : text= f"{mnem} " + fmt.format( (addr+2+(data[pos+1] ^ 0x80)-0x80) & 0xFFFF )
+      elif num==1 : text= f"{mnem} " + fmt.format( data[pos+1] )
+      else : text= f"{mnem} " + fmt.format( data[pos+1]+256*data[pos+2] )
+      yield (addr,pos,size,text)
+      pos+= size
+    else :
+      # data row: extends over data bytes (or undecodable opcodes), up to 8 bytes
+      size= 1
+      while size<8 and pos+size<len(data) and not isbreak[pos+size] and isdata[pos+size]==isdata[pos] and (isdata[pos] or not (with_illegal or table[data[pos+size]][3])) :
+        size+= 1
+      yield (load+pos-2,pos,size,".byte "+",".join( f"${d:02X}" for d in data[pos:pos+size] ))
+      pos+= size
+
+
 #endregion
 #region ### DUALLINE ################################################################
 
@@ -475,18 +1057,76 @@ class Dualline :
 blocks=[] # The whole d64 file, as a list of Block's (see class below)
 
 
-# Find a block, given track and sector index
-def block_find(tix,six) : 
-  for block in blocks:
-    if block.tix==tix and block.six==six : return block
-  return None
+# Makes `content` the current disk (`blocks`); for collection views that load one image after the other
+def set_blocks(content) :
+  global blocks
+  blocks= [ Block(bix,content[bix*BYTESPERBLOCK:(bix+1)*BYTESPERBLOCK]) for bix in range(len(content)//BYTESPERBLOCK) ]
+
 
+# Returns True iff all bytes of block `data` are 0x00
+def block_isempty(data) :
+  return not any(data)
 
-def print_blockmap():
+
+# Returns the file content stored in the blocks of `chain` (an iterable of blocks)
+def chain2bin(chain) :
+  bins= []
+  for block in chain :
+    if block.data[0x00]==0x00 :
+      # data[0x00]=tix=00, so last block
+      last=block.data[0x01]
+      bins.append( block.data[0x02:last+1] )
+    else :
+      bins.append( block.data[0x02:] )
+  return b''.join(bins)
+
+
+# Find a block, given track and sector index (returns None if there is no such block)
+def block_find(tix,six) : 
+  if tix<1 or tix>=len(SECTORSPERTRACK)-1 : return None
+  if six<0 or six>=SECTORSPERTRACK[tix] : return None
+  return blocks[TRACKSTART[tix]+six]
+
+
+# Prints the lines produced by generator `lines`.
+# When `limit` is given, only page `page` (1-based) of `limit` lines is printed.
+# Lines are pulled one at a time, so a limit (or a consumer that stops reading) stops the rendering.
+# They go to stream `file` (default stdout).
+def emit(lines,limit=None,page=1,file=None) :
+  if limit!=None : lines= itertools.islice(lines,(page-1)*limit,page*limit)
+  for line in lines : print(line,file=file)
+
+
+# Writes `records` (dicts) to `out` as one JSON array ("json") or one JSON object per line ("ndjson").
+# Records are written as they are generated, nothing is collected.
+def emit_records(records,fmt,out,limit=None,page=1) :
+  if limit!=None : records= itertools.islice(records,(page-1)*limit,page*limit)
+  if fmt=="ndjson" :
+    for record in records : out.write( json.dumps(record,ensure_ascii=False)+"\n" )
+    return
+  sep= "[\n"
+  for record in records :
+    out.write( sep+json.dumps(record,ensure_ascii=False) )
+    sep= ",\n"
+  out.write( "[]\n" if sep=="[\n" else "\n]\n" )
+
+
+# Generates a record per block of the current disk (the data of the disk view, with the block_stats)
+def gen_diskrecords() :
+  stats= block_stats( b"".join(block.data for block in blocks) )
+  for block in blocks :
+    (empty,entropy,cls,xor)= stats[block.bix]
+    yield {'record':"block", 'block':block.bix, 'track':block.tix, 'sector':block.six, 'zone':block.zix, 'type':block.typ, 'empty':empty, 'entropy':round(entropy,3), 'class':cls, 'xor':xor, 'error':block.err}
+
+
+# Prints the disk map, all tracks or only the tracks in `tixs`.
+# With `stats` (see block_stats) each block is a heatmap cell: its entropy as shade, its class as letter.
+def print_blockmap(tixs=None,stats=None):
   print( f"|track|zone|   blocks    | 000 001 002 003 004 005 006 007 007 009 010 011 012 013 014 015 016 017 018 019 020 |")
   tix=0
   zix=-1
   for block in blocks:
+    if tixs!=None and block.tix not in tixs : continue
     if block.zix!=zix :
       print( f"|-----|----|-------------|-------------------------------------------------------------------------------------|")
       zix=block.zix
@@ -496,34 +1136,68 @@ def print_blockmap():
     typ= block.typ
     if block.isempty(): typ= typ.lower()
     if typ=="fil" : typ='---'
+    if stats!=None : 
+      (empty,entropy,cls,xor)= stats[block.bix]
+      typ= STATSHEAT[min(len(STATSHEAT)-1,int(entropy*len(STATSHEAT)/8))]*2 + STATSCLASSES[cls]
+    if block.err!=None : typ='ERR'
     print( f" {typ}", end='' )
     if block.six+1==SECTORSPERTRACK[block.tix] : 
       print( " "*((21-SECTORSPERTRACK[block.tix])*4)+" |")
   print( f"|-----|----|-------------|-------------------------------------------------------------------------------------|")
+  if stats!=None :
+    print( "heat: entropy "+" ".join( f"'{STATSHEAT[i]}'<{(i+1)*8/len(STATSHEAT):.1f}" for i in range(len(STATSHEAT)-1) )+f" '{STATSHEAT[-1]}'<=8 bits/byte; class "+" ".join( f"{letter}={cls}" for cls,letter in STATSCLASSES.items() ) )
 
 
-def get_dir():
-  dir=[]
-  for six in range(1,21) :
-    block=blocks[357+six]
-    for eix in range(0,256,32) :
-      ftype = filetype2str(block.data[eix+0x02])
-      block1= block_find(block.data[eix+0x03],block.data[eix+0x04])
-      bix= None if block1==None else block1.bix
-      fname= filename2str( block.data[eix+0x05:eix+0x14+1] )
-      fsize= block.data[eix+0x1E] + 256*block.data[eix+0x1F]
-      if block.data[eix+0x02] & 0b111 == 0b000 : continue # skip DEL
-      dir.append( {'size':fsize,'fname':fname,'ftype':ftype,'block1':bix} )
-  return dir
+# One directory entry, as unpacked from a directory block (all fields raw, fname/ftype/block1 derived on access)
+class DirEntry :
+  __slots__= ('block','eix','rawtype','tix','six','rawname','sstix','sssix','reclen','rawgeos','size')
+  FORMAT= struct.Struct('<BBBBB16sBBB6sH') # t/s-link (only in entry 0), type, t/s first block, name, t/s side sector, record length, unused (GEOS), size
+
+  def __init__(self,block,eix,fields) :
+    (_,_,self.rawtype,self.tix,self.six,self.rawname,self.sstix,self.sssix,self.reclen,self.rawgeos,self.size)= fields
+    self.block= block # directory block holding this entry
+    self.eix= eix     # offset of this entry in `block`
+
+  def isdeleted(self) :
+    return self.rawtype & 0b111 == 0b000
+
+  @property
+  def fname(self) :
+    return filename2str(self.rawname)
+
+  @property
+  def ftype(self) :
+    return filetype2str(self.rawtype)
+
+  # Block index of the first block, None if the t/s is not on the disk
+  @property
+  def block1(self) :
+    block1= block_find(self.tix,self.six)
+    return None if block1==None else block1.bix
+
+  # GEOS file type (0 for a plain C64 file); then the side sector t/s is the info block, and record length the structure
+  @property
+  def geostype(self) :
+    return self.rawgeos[0]
+
+  def isvlir(self) :
+    return self.geostype!=0 and self.reclen==0x01
+
+
+# Generates the DirEntry's of the current disk (`blocks`), lazily, following the directory chain from 18/1.
+# Each directory block is unpacked in one go; DEL entries are skipped unless `with_deleted`.
+def iter_dir(with_deleted=False) :
+  for nexts,block in blocks[TRACKSTART[18]+1].chain() :
+    for eix,fields in enumerate(DirEntry.FORMAT.iter_unpack(block.data)) :
+      entry= DirEntry(block,32*eix,fields)
+      if with_deleted or not entry.isdeleted() : yield entry
 
 
 class Block:
 
   # Returns True iff all data bytes are 0x00
   def isempty(self):
-    for b in self.data:
-      if b!=0x00: return False
-    return True
+    return block_isempty(self.data)
 
   # Returns the next block, using the t/s-link in the current (returns None if link is oef)
   def next(self):
@@ -543,28 +1217,55 @@ class Block:
         pass
     return block
 
+  # Generator over this block and at most `with_nexts` next blocks, following the t/s-links.
+  # Yields (nexts,block) with nexts the number of next blocks still requested after `block`.
+  # Stops at end of chain, at a broken link, or when a block repeats (t/s-links form a loop).
+  # Iterative and with a fixed size administration, so chain length does not matter.
+  def chain(self,with_nexts=BLOCKSPERDISK):
+    visited= bytearray(BLOCKSPERDISK)
+    block= self
+    while True :
+      visited[block.bix]= 1
+      yield (with_nexts,block)
+      if with_nexts==0 : return
+      block= block.next()
+      if block==None or visited[block.bix] : return
+      with_nexts-= 1
+
+  # Returns the line explaining why a chain ended at this block, while `nexts` blocks were still requested
+  def chain_end(self,nexts):
+    block= self.next()
+    if block==None : return f"no next block (request was {nexts})"
+    return f"next block {block.bix} already shown, chain loops (request was {nexts})"
+
   # Returns the block id as a long string
   def get_blockid(self):
-    return f"block {self.bix} zone {self.zix}/{self.zsz} track {self.tix} sector {self.six} type {self.typ}"
+    err= "" if self.err==None else f" ERROR {self.err}"
+    return f"block {self.bix} zone {self.zix}/{self.zsz} track {self.tix} sector {self.six} type {self.typ}{err}"
 
   # Returns block and its successors as a bin array
   def tobin(self):
-    block= self
-    bin=b''
-    while block.data[0x00]!=0x00 :
-      bin+= block.data[0x02:]
-      block= block.next()
-    # data[0x00]=tix=00, so last block
-    last=block.data[0x01]
-    bin+= block.data[0x02:last+1]
-    return bin
-
-  # Block prints itself in hex format
-  def print_hex(self,with_blockid=True,with_header=True,with_nexts=0):
-    if with_blockid : print( f"|{self.get_blockid():-<75}|")
-    if with_header : 
-      print( f"|offset| 00 01 02 03 04 05 06 07 08 09 0A 0B 0C 0D 0E 0F | 0123456789ABCDEF |")
-      print( f"|------|-------------------------------------------------|------------------|")
+    return chain2bin( block for nexts,block in self.chain() )
+
+  # Block renders itself (and `with_nexts` next blocks) in hex format, generates lines
+  def gen_hex(self,with_blockid=True,with_header=True,with_nexts=0):
+    for nexts,block in self.chain(with_nexts) :
+      yield from block._gen_hex1(with_blockid,with_header)
+    if nexts>0 : yield block.chain_end(nexts)
+
+  # Block generates a record per hex row, for itself and `with_nexts` next blocks
+  def gen_hexrecords(self,with_nexts=0):
+    for nexts,block in self.chain(with_nexts) :
+      for dix in range(0,BYTESPERBLOCK,16):
+        row= block.data[dix:dix+16]
+        yield {'record':"hexrow", 'block':block.bix, 'track':block.tix, 'sector':block.six, 'offset':dix, 'hex':bytes(row).hex().upper(), 'text':petscii2str(row)}
+
+  # Block renders itself (only) in hex format, generates lines
+  def _gen_hex1(self,with_blockid,with_header):
+    if with_blockid : yield f"|{self.get_blockid():-<75}|"
+    if with_header :
+      yield f"|offset| 00 01 02 03 04 05 06 07 08 09 0A 0B 0C 0D 0E 0F | 0123456789ABCDEF |"
+      yield f"|------|-------------------------------------------------|------------------|"
     if self.data[0x00]==0x00 :
       # tix=00, so last block
       last_dix=self.data[0x01]
@@ -572,23 +1273,42 @@ class Block:
       last_dix=0x255
     linesep=" "
     for dix1 in range(0,BYTESPERBLOCK,16):
-      print( f"|  {dix1:^02X}  |", end='' )
+      line= f"|  {dix1:^02X}  |"
       for dix2 in range(dix1,dix1+16):
         if dix2>last_dix: linesep="*"
-        print( f"{linesep}{self.data[dix2]:02X}", end='')
-      print( f"{linesep}| ", end='' )
-      for dix2 in range(dix1,dix1+16):
-        ch= makeprintable(chr(self.data[dix2]))
-        print( ch, end='')
-      print(" |")
-    if with_header : 
-      print( f"|------|-------------------------------------------------|------------------|")
-    if with_nexts>0 :
-      block= self.next()
-      if block!=None : 
-        block.print_hex(with_blockid,with_header,with_nexts-1)
-      else : 
-        print( f"no next block (request was {with_nexts})")
+        line+= f"{linesep}{self.data[dix2]:02X}"
+      line+= f"{linesep}| "
+      line+= petscii2str(self.data[dix1:dix1+16])
+      yield line+" |"
+    if with_header :
+      yield f"|------|-------------------------------------------------|------------------|"
+
+  # Block (the BAM) generates a record for the disk header, followed by a record per track with its free count and sector bits
+  def gen_bamrecords(self):
+    free= sum( self.data[4*tix] for tix in range(1,len(SECTORSPERTRACK)-1) if tix!=18 )
+    yield {'record':"bam", 'block':self.bix, 'dosversion':filename2str(self.data[0x02:0x03]), 'diskname':filename2str(self.data[0x90:0xA0]), 
+           'diskid':filename2str(self.data[0xA2:0xA4]), 'dostype':filename2str(self.data[0xA5:0xA7]), 'free':free, 'blocks':BLOCKSPERDISK}
+    for tix in range(1,len(SECTORSPERTRACK)-1) :
+      matrix= int.from_bytes(self.data[4*tix+1:4*tix+4],'little')
+      bits= f"{matrix:024b}"[::-1][:SECTORSPERTRACK[tix]]
+      yield {'record':"bamtrack", 'track':tix, 'free':self.data[4*tix], 'bits':bits}
+
+  # Block (first of a basic program) generates a record per basic line (in `linerange`, if passed), following `with_nexts` next blocks
+  def gen_basicrecords(self,with_nexts=0,linerange=None):
+    data= chain2bin( block for nexts,block in self.chain(with_nexts) )
+    for (addr,nextaddr,linenum,text) in basic_lines(data) :
+      if linerange!=None and not linerange[0]<=linenum<=linerange[1] : continue
+      yield {'record':"basicline", 'addr':addr, 'nextaddr':nextaddr, 'line':linenum, 'text':bin2bas(text)}
+
+  # Block (first of a PRG file) generates a record per disassembled instruction or data row, following `with_nexts` next blocks
+  def gen_asmrecords(self,with_nexts=0,with_illegal=False):
+    chain= [block for nexts,block in self.chain(with_nexts)]
+    data= chain2bin(chain)
+    if len(data)<2 : return
+    load= data[0]+256*data[1]
+    breaks= [load-2+k*(BYTESPERBLOCK-2) for k in range(1,len(chain))]
+    for (addr,pos,size,text) in disassemble(data,data_ranges(data),with_illegal,breaks) :
+      yield {'record':"asmline", 'block':chain[pos//(BYTESPERBLOCK-2)].bix, 'offset':2+pos%(BYTESPERBLOCK-2), 'addr':addr, 'hex':bytes(data[pos:pos+size]).hex().upper(), 'text':text}
 
   # Block prints itself in technical BAM format (all raw bytes annotated)
   def print_bamtech(self,with_blockid=False,with_header=True) :
@@ -650,19 +1370,60 @@ class Block:
     if with_header : 
       print( f"|-----------|--------------------------------------|" )
 
-  # Block prints itself in technical dir format (all raw bytes annotated)
-  def print_dirtech(self,with_blockid=True,with_header=True,with_nexts=0,with_rawdata=True,label=0):
-    if with_blockid : print( f"|{self.get_blockid():-<127}|")
+  # Block renders itself (and `with_nexts` next blocks) as 6502 disassembly (block must be first of a PRG file), generates lines
+  def gen_asm(self,with_blockid=True,with_header=True,with_nexts=0,with_illegal=False):
+    chain= [block for nexts,block in self.chain(with_nexts)]
+    data= chain2bin(chain)
+    if len(data)<2 : 
+      yield f"no load address in block {self.bix}"
+      return
+    load= data[0]+256*data[1]
+    breaks= [load-2+k*(BYTESPERBLOCK-2) for k in range(1,len(chain))]
+    linesep= "|------|----|-------------------------|------------------------------------------|"
+    if with_blockid : yield f"|{self.get_blockid():-<{len(linesep)-2}}|"
+    if with_header :
+      yield "| addr |offs| bytes                   | disassembly                              |"
+      yield linesep
+    yield f"| load | 02 | {data[0]:02X} {data[1]:02X}                   | {f'(decimal {load:5})':<40} |"
+    k= 0 
+    for (addr,pos,size,text) in disassemble(data,data_ranges(data),with_illegal,breaks) :
+      if pos//(BYTESPERBLOCK-2)!=k :
+        k= pos//(BYTESPERBLOCK-2)
+        if with_blockid : yield f"|{chain[k].get_blockid():-<{len(linesep)-2}}|"
+      raw= ' '.join( f"{d:02X}" for d in data[pos:pos+size] )
+      yield f"| {addr:04X} | {2+pos%(BYTESPERBLOCK-2):02X} | {raw:<23} | {text:<40} |"
+    if with_header : yield linesep
+
+  # Block generates a record per directory entry, for itself and `with_nexts` next blocks (DEL entries only `with_deleted`)
+  def gen_dirrecords(self,with_nexts=0,with_deleted=False):
+    for nexts,block in self.chain(with_nexts) :
+      for eix,fields in enumerate(DirEntry.FORMAT.iter_unpack(block.data)) :
+        entry= DirEntry(block,32*eix,fields)
+        if entry.isdeleted() and not with_deleted : continue
+        yield {'record':"direntry", 'block':block.bix, 'entry':eix, 'size':entry.size, 'name':entry.fname, 'type':entry.ftype, 
+               'track':entry.tix, 'sector':entry.six, 'block1':entry.block1}
+
+  # Block renders itself (and `with_nexts` next blocks) in technical dir format (all raw bytes annotated), generates lines
+  def gen_dirtech(self,with_blockid=True,with_header=True,with_nexts=0,with_rawdata=True,label=0):
+    for nexts,block in self.chain(with_nexts) :
+      yield from block._gen_dirtech1(with_blockid,with_header,with_rawdata,label)
+      with_header= False # only first block has a header
+      label+= 8
+    if nexts>0 : yield block.chain_end(nexts)
+
+  # Block renders itself (only) in technical dir format, generates lines
+  def _gen_dirtech1(self,with_blockid,with_header,with_rawdata,label):
+    if with_blockid : yield f"|{self.get_blockid():-<127}|"
     if with_header : 
-      print( f"|label|nextdir|filetype| block1| filename                                        | relss |relrecsz| unused            |file size|")
-      print( f"|-----|-------|--------|-------|-------------------------------------------------|-------|--------|-------------------|---------|")
+      yield f"|label|nextdir|filetype| block1| filename                                        | relss |relrecsz| unused            |file size|"
+      yield f"|-----|-------|--------|-------|-------------------------------------------------|-------|--------|-------------------|---------|"
     for eix in range(0,256,32) :
       if with_rawdata :
-        print( f"|{label:^5}| {self.data[eix+0x00]:02X} {self.data[eix+0x01]:02X} |   {self.data[eix+0x02]:02X}   | {self.data[eix+0x03]:02X} {self.data[eix+0x04]:02X} |", end='' )
-        for d in self.data[eix+0x05:eix+0x14+1] : print(f" {d:02X}", end='')
-        print( f" | {self.data[eix+0x15]:02X} {self.data[eix+0x16]:02X} |   {self.data[eix+0x17]:02X}   |", end='' )
-        for d in self.data[eix+0x18:eix+0x1D+1] : print(f" {d:02X}", end='')
-        print( f" |  {self.data[eix+0x1E]:02X} {self.data[eix+0x1F]:02X}  |" )
+        line= f"|{label:^5}| {self.data[eix+0x00]:02X} {self.data[eix+0x01]:02X} |   {self.data[eix+0x02]:02X}   | {self.data[eix+0x03]:02X} {self.data[eix+0x04]:02X} |"
+        for d in self.data[eix+0x05:eix+0x14+1] : line+= f" {d:02X}"
+        line+= f" | {self.data[eix+0x15]:02X} {self.data[eix+0x16]:02X} |   {self.data[eix+0x17]:02X}   |"
+        for d in self.data[eix+0x18:eix+0x1D+1] : line+= f" {d:02X}"
+        yield line+f" |  {self.data[eix+0x1E]:02X} {self.data[eix+0x1F]:02X}  |"
       # The entry track/sector link (shall be 0/0 exept for first)
       ts_nextdir= f"{self.data[eix+0x00]}/{self.data[eix+0x01]}"
       # Actual file type
@@ -675,8 +1436,10 @@ class Block:
       ts_relss = f"{self.data[eix+0x15]}/{self.data[eix+0x16]}" 
       # REL file record length (REL file only, max. value 254)
       relrecsize = self.data[eix+0x017]
-      # 18-1D: Unused (except with GEOS disks)
-      # self.data[eix+0x018..eix+0x01D]
+      # 18-1D: Unused (except with GEOS disks: GEOS file type, date)
+      geos= ""
+      if self.data[eix+0x18]!=0 and self.data[eix+0x02] & 0b111 != 0b000 : 
+        geos= f"GEOS {geos_typename(self.data[eix+0x18])[:8]} {'VLIR' if self.data[eix+0x17]==0x01 else 'SEQ'}"
       # File size in blocks (little endian);  in bytes approx #blocks * 254
       fsize= self.data[eix+0x1E] +256*self.data[eix+0x1F]
       # apply na
@@ -685,23 +1448,24 @@ class Block:
         relrecsize='na'
       else :
         relrecsize=str(relrecsize)+' byte'
-      print( f"|{label:^5}|{ts_nextdir:^7s}|{ftype:^8s}|{ts_block1:^7s}| {fname:{16*3}}|{ts_relss:^7s}|{relrecsize:^8s}|{'':{6*3}} |{str(fsize)+' block':^9s}|" ) 
+      yield f"|{label:^5}|{ts_nextdir:^7s}|{ftype:^8s}|{ts_block1:^7s}| {fname:{16*3}}|{ts_relss:^7s}|{relrecsize:^8s}|{geos:{6*3}} |{str(fsize)+' block':^9s}|"
       label+=1
     if with_header : 
-      print( f"|-----|-------|--------|-------|-------------------------------------------------|-------|--------|-------------------|---------|")
-    if with_nexts>0 :
-      block= self.next()
-      if block!=None : 
-        block.print_dirtech(with_blockid=with_blockid,with_header=False,with_nexts=with_nexts-1,with_rawdata=with_rawdata,label=label)
-      else : 
-        print( f"no next block (request was {with_nexts})")
-
-  # Block prints itself in human dir format (filename/filetype)
-  def print_dirhuman(self,with_blockid=True,with_header=True,with_nexts=17):
-    if with_blockid : print( f"|{self.get_blockid():-<52}|" )
+      yield f"|-----|-------|--------|-------|-------------------------------------------------|-------|--------|-------------------|---------|"
+
+  # Block renders itself (and `with_nexts` next blocks) in human dir format (filename/filetype), generates lines
+  def gen_dirhuman(self,with_blockid=True,with_header=True,with_nexts=17):
+    for nexts,block in self.chain(with_nexts) :
+      yield from block._gen_dirhuman1(with_blockid,with_header)
+      with_header= False # only first block has a header
+    if nexts>0 : yield block.chain_end(nexts)
+
+  # Block renders itself (only) in human dir format, generates lines
+  def _gen_dirhuman1(self,with_blockid,with_header):
+    if with_blockid : yield f"|{self.get_blockid():-<52}|"
     if with_header : 
-      print( f"| blocks | filename           | filetype | block1    |" )
-      print( f"|--------|--------------------|----------|-----------|" )
+      yield f"| blocks | filename           | filetype | block1    |"
+      yield f"|--------|--------------------|----------|-----------|"
     for eix in range(0,256,32) :
       ftype = filetype2str(self.data[eix+0x02])
       block1= block_find(self.data[eix+0x03],self.data[eix+0x04])
@@ -709,16 +1473,11 @@ class Block:
       fname= "'"+filename2str( self.data[eix+0x05:eix+0x14+1] )+"'"
       fsize= self.data[eix+0x1E] +256*self.data[eix+0x1F]
       if self.data[eix+0x02] & 0b111 == 0b000 : continue # skip DEL
-      print( f"| {fsize:^6} | {fname:<18s} | {ftype:^8s} |{ts_block1}|" ) 
-    if with_nexts>0 :
-      block= self.next()
-      if block!=None : 
-        block.print_dirhuman(with_blockid=with_blockid,with_header=False,with_nexts=with_nexts-1)
-      else : 
-        print( f"no next block (request was {with_nexts})")
+      yield f"| {fsize:^6} | {fname:<18s} | {ftype:^8s} |{ts_block1}|"
 
   # Block prints itself in technical basic format (all raw bytes annotated)
-  def print_filebasic(self,block1=True,addr=None,prvdata=b"",with_blockid=True,with_header=True,with_nexts=0,for_human=False):
+  # Only lines with a line number in `linerange` (lo,hi) are printed, if passed (partial lines and end of file are always printed)
+  def print_filebasic(self,block1=True,addr=None,prvdata=b"",with_blockid=True,with_header=True,with_nexts=0,for_human=False,linerange=None):
 
     tablen=132
     def printlink(data) :
@@ -751,7 +1510,6 @@ class Block:
     (addr,offset,prvdata,curdata,nxtdata)= iter.gotofirst()
     while True :
       # We are goin to print two lines (hex and human)
-      if not for_human : print(linesep)
       dual= Dualline(tablen,"      |    |        |       | ",":"+CHAR00,for_human)
 
       ###### print "header columns":  addr, offs, nextaddr, linenum
@@ -772,6 +1530,9 @@ class Block:
         data3="  "
         linenum="     " 
       
+      inrange= linerange==None or linenum=="     " or linerange[0]<=int(linenum)<=linerange[1]
+      if not for_human and inrange : print(linesep)
+
       # start outputting  
       if len(prvdata)==0 :
         dual.add( f"|  {data0} {data1} " , f"|  {nextaddr} " )
@@ -825,7 +1586,7 @@ class Block:
         dual.add( f"{d:02X} ", f"{token(d)}" )
 
       # actually print all collected data
-      dual.print()
+      if inrange : dual.print()
 
       # special annotation at end of file
       if nextaddr=="    0" :
@@ -870,7 +1631,1546 @@ class Block:
       self.typ='DIR'
       if self.six==0 :
         self.typ='BAM'
+    self.err=None    # decode error of the block (G64 only)
+
+
+
+#endregion
+#region ### BLOCK STATS #############################################################
+
+# Per block statistics of a whole image, all blocks in one go (with numpy, else per block in plain python).
+# The class of a block follows from its byte histogram:
+#   empty      all bytes 00
+#   fill       one byte value makes up STATSFILL or more of the block (e.g. formatted, never written)
+#   text       STATSTEXT or more bytes are PETSCII text (20..5F, 0D, A0)
+#   compressed entropy STATSCOMPRESSED or more bits per byte (256 random bytes reach 7.2)
+#   code       anything else (6502 code, tables, tokenized basic)
+STATSFILL       = 192
+STATSTEXT       = 192
+STATSCOMPRESSED = 6.8
+STATSCLASSES    = { "empty":".", "fill":"f", "text":"t", "code":"c", "compressed":"z" } # class to letter in heatmap
+STATSTEXTBYTES  = bytes(range(0x20,0x60))+b"\x0D\xA0"
+STATSHEAT       = " ░▒▓█" # entropy 0..8 in five levels
+
+
+def stats_class(empty,entropy,maxcount,ntext) :
+  if empty : return "empty"
+  if maxcount>=STATSFILL : return "fill"
+  if ntext>=STATSTEXT : return "text"
+  if entropy>=STATSCOMPRESSED : return "compressed"
+  return "code"
+
+
+# Returns a (empty,entropy,class,xor) tuple for each block in `content`; xor is the 1541 data block checksum
+def block_stats(content) :
+  nblocks= len(content)//BYTESPERBLOCK
+  if numpy!=None :
+    data= numpy.frombuffer(content,dtype=numpy.uint8,count=nblocks*BYTESPERBLOCK).reshape(nblocks,BYTESPERBLOCK)
+    # one bincount for all histograms: block bix counts in bins bix*256..bix*256+255
+    hist= numpy.bincount( (data+numpy.arange(nblocks,dtype=numpy.int64)[:,None]*256).ravel(), minlength=nblocks*256 ).reshape(nblocks,256)
+    prob= hist/BYTESPERBLOCK
+    entropy= -(prob*numpy.log2(numpy.where(hist>0,prob,1))).sum(axis=1)
+    istext= numpy.zeros(256,dtype=bool)
+    istext[list(STATSTEXTBYTES)]= True
+    columns= ( ~data.any(axis=1), entropy+0.0, hist.max(axis=1), hist[:,istext].sum(axis=1), numpy.bitwise_xor.reduce(data,axis=1) )
+    rows= zip(*(column.tolist() for column in columns))
+  else :
+    rows= []
+    for bix in range(nblocks) :
+      data= content[bix*BYTESPERBLOCK:(bix+1)*BYTESPERBLOCK]
+      counts= [data.count(b) for b in set(data)]
+      entropy= -sum( c/BYTESPERBLOCK*math.log2(c/BYTESPERBLOCK) for c in counts )
+      ntext= BYTESPERBLOCK-len(data.translate(None,STATSTEXTBYTES))
+      rows.append( (block_isempty(data), entropy+0.0, max(counts), ntext, functools.reduce(operator.xor,data,0)) )
+  return [ (empty,entropy,stats_class(empty,entropy,maxcount,ntext),xor) for (empty,entropy,maxcount,ntext,xor) in rows ]
+
+
+#endregion
+#region ### LOAD TIME ###############################################################
+
+
+RPM=300                 # Rotation speed of a 1541 disk (revolutions per minute)
+STEPTIME=0.012          # Time (s) to move the head one track further, including settling
+BLOCKPROCESSTIME=0.080  # Time (s) drive and C64 need to handle a block, before the next one can be read (standard loader, fits interleave 10)
+SLOWRATIO=1.25          # A file whose load time exceeds its ideal load time by this factor is flagged as badly interleaved
+
+
+# Returns the sector skip (number of sectors from one block to the next) that minimizes load time on track tix
+def best_skip(tix,proctime=BLOCKPROCESSTIME) :
+  sectortime= 60/RPM/SECTORSPERTRACK[tix]
+  return math.ceil(proctime/sectortime)+1
+
+
+# Generator estimating the load time of the blocks in `chain` (list of Block's of one file).
+# The head starts on track 18 (directory), at a random position (half a revolution latency on average).
+# Yields (block,skip,steps,wait,time) per block: sector skip from previous block (None for first or other track), 
+# tracks stepped, time waited for the sector to pass under the head, and the total time so far (all in seconds).
+# Sector k of a track with n sectors is assumed to start at k/n of a revolution (all tracks aligned).
+def gen_loadtime(chain,proctime=BLOCKPROCESSTIME) :
+  rev= 60/RPM
+  time= 0.0
+  angle= None # position of the head in revolutions (0..1), unknown at start
+  tix= 18
+  prev= None
+  for block in chain :
+    num= SECTORSPERTRACK[block.tix]
+    steps= abs(block.tix-tix)
+    time+= steps*STEPTIME
+    if angle==None :
+      wait= rev/2
+    else :
+      angle= (angle+steps*STEPTIME/rev) % 1.0
+      wait= ((block.six/num-angle) % 1.0)*rev
+    time+= wait+rev/num+proctime # wait for sector, read it, process it
+    angle= ((block.six+1)/num+proctime/rev) % 1.0
+    skip= None if prev==None or prev.tix!=block.tix else (block.six-prev.six) % num
+    yield (block,skip,steps,wait,time)
+    tix= block.tix
+    prev= block
+
+
+# Returns the ideal load time of `chain`: same blocks on the same tracks, but every next block at the best skip
+def ideal_loadtime(chain,proctime=BLOCKPROCESSTIME) :
+  rev= 60/RPM
+  time= rev/2 # latency for the first block
+  tix= 18
+  for ix,block in enumerate(chain) :
+    sectortime= rev/SECTORSPERTRACK[block.tix]
+    time+= abs(block.tix-tix)*STEPTIME + sectortime + proctime
+    if ix>0 : time+= max(0.0,(best_skip(block.tix,proctime)-1)*sectortime-proctime) # remaining wait for the next block
+    tix= block.tix
+  return time
+
+
+# Returns a summary dict of the load time of the file starting at `block1`
+def loadtime_summary(block1,proctime=BLOCKPROCESSTIME) :
+  chain= [block for nexts,block in block1.chain()]
+  skips= {}
+  revs= 0
+  steps= 0
+  time= 0.0
+  for (block,skip,step,wait,time) in gen_loadtime(chain,proctime) :
+    if skip!=None : skips[skip]= skips.get(skip,0)+1
+    if block!=chain[0] and wait>=60/RPM/2 : revs+= 1 # waited more than half a revolution
+    steps+= step
+  ideal= ideal_loadtime(chain,proctime)
+  return { 'blocks':len(chain), 'tracks':len({block.tix for block in chain}), 'steps':steps, 
+           'skip': max(skips,key=skips.get) if skips else None, 'revs':revs, 'time':time, 'ideal':ideal, 
+           'slow': time>ideal*SLOWRATIO }
+
+
+# Generates a load time record per directory entry in `entries` (DirEntry's, see iter_dir)
+def gen_loadrecords(entries,proctime=BLOCKPROCESSTIME) :
+  for entry in entries :
+    record= {'record':"load", 'name':entry.fname, 'block1':entry.block1}
+    if entry.block1!=None : 
+      summary= loadtime_summary(blocks[entry.block1],proctime)
+      record.update( (key,summary[key]) for key in ('blocks','tracks','skip','revs','time','ideal','slow') )
+    yield record
+
+
+# Generator of the lines of the load time table for the directory entries `entries` (DirEntry's, see iter_dir)
+def gen_loadhuman(entries,with_header=True,proctime=BLOCKPROCESSTIME) :
+  linesep= "|--------------------|--------|--------|------|------|---------|---------|-------|------|"
+  if with_header :
+    yield "| filename           | blocks | tracks | skip | revs | time    | ideal   | ratio | flag |"
+    yield linesep
+  total= 0.0
+  totalideal= 0.0
+  numslow= 0
+  numblocks= 0
+  numrevs= 0
+  for entry in entries :
+    fname= "'"+entry.fname+"'"
+    block1= entry.block1
+    if block1==None : 
+      yield f"| {fname:<18s} | {'no first block':<63} |"
+      continue
+    summary= loadtime_summary(blocks[block1],proctime)
+    total+= summary['time']
+    totalideal+= summary['ideal']
+    if summary['slow'] : numslow+= 1
+    numblocks+= summary['blocks']
+    numrevs+= summary['revs']
+    skip= '-' if summary['skip']==None else summary['skip']
+    yield f"| {fname:<18s} | {summary['blocks']:^6} | {summary['tracks']:^6} | {skip:^4} | {summary['revs']:^4} | {summary['time']:5.2f} s | {summary['ideal']:5.2f} s | {summary['time']/summary['ideal']:5.2f} | {'SLOW' if summary['slow'] else '':4} |"
+  if with_header : yield linesep
+  ratio= total/totalideal if totalideal>0 else 1.0
+  yield f"| {f'disk ({numslow} slow)':<18s} | {numblocks:^6} |        |      | {numrevs:^4} | {total:5.2f} s | {totalideal:5.2f} s | {ratio:5.2f} | {'SLOW' if numslow>0 else '':4} |"
+  if with_header : yield linesep
+
+
+# Generator of the lines of the per block load time table for the file starting at `block1`
+def gen_loadtech(block1,with_header=True,proctime=BLOCKPROCESSTIME) :
+  linesep= "|-------|-------|------|-------|----------|----------|"
+  if with_header :
+    yield "| block | t/s   | skip | steps | wait     | time     |"
+    yield linesep
+  chain= [block for nexts,block in block1.chain()]
+  for (block,skip,steps,wait,time) in gen_loadtime(chain,proctime) :
+    ts= f"{block.tix}/{block.six}"
+    yield f"| {block.bix:^5} | {ts:^5} | {'-' if skip==None else skip:^4} | {steps:^5} | {wait*1000:5.1f} ms | {time*1000:6.0f} ms |"
+  if with_header : yield linesep
+  ideal= ideal_loadtime(chain,proctime)
+  yield f"ideal {ideal:.2f} s with skip {best_skip(chain[0].tix,proctime)} on track {chain[0].tix} (processing {proctime*1000:.0f} ms per block)"
+
+
+#endregion
+#region ### G64 #####################################################################
+
+# A G64 file stores the raw GCR bit stream of each (half) track, as read from the disk surface.
+# Layout: signature "GCR-1541", version (00), number of half tracks (e.g. 84), max track size (2 bytes),
+# then per half track a 4 byte offset to the track (0 if absent), then per half track a 4 byte speed zone.
+# A track at its offset starts with its length in bytes (2 bytes), followed by the GCR bytes.
+# On a track each sector has a header block and a data block, each preceded by a sync mark (10 or more 1-bits).
+# GCR encodes every 4 bits (nibble) in 5 bits, so that there are never more than two 0-bits in a row.
+#   header block: 08, checksum, sector, track, id2, id1, 0F, 0F (8 bytes, 10 GCR bytes), checksum is xor of sector..id1
+#   data block  : 07, 256 data bytes, checksum, 00, 00 (260 bytes, 325 GCR bytes), checksum is xor of the data bytes
+# http://unusedino.de/ec64/technical/formats/g64.html
+
+
+G64SIGNATURE = b"GCR-1541"
+
+
+GCRENCODE = [ # 5 bit GCR code per nibble
+  0b01010, 0b01011, 0b10010, 0b10011, 0b01110, 0b01111, 0b10110, 0b10111, # 0..7
+  0b01001, 0b11001, 0b11010, 0b11011, 0b01101, 0b11101, 0b11110, 0b10101, # 8..F
+]
+
+
+# Precomputed: byte per 10 GCR bits (two 5 bit codes), or -1 when either code is not a GCR code
+GCRDECODE = [-1]*1024
+for hi in range(16) :
+  for lo in range(16) :
+    GCRDECODE[GCRENCODE[hi]<<5 | GCRENCODE[lo]]= hi<<4 | lo
+
+
+# Decodes `num` bytes from the GCR bit string `bits` (str of '0' and '1') starting at `pos`.
+# Returns the bytes, and the number of invalid GCR codes (invalid codes decode as 00).
+def gcr_decode(bits,pos,num) :
+  if pos+10*num>len(bits) : return (None,num)
+  value= int(bits[pos:pos+10*num],2) # whole block converted in one go
+  data= bytearray(num)
+  bad= 0
+  for ix in range(num) :
+    d= GCRDECODE[ (value>>(10*(num-1-ix))) & 0x3FF ]
+    if d<0 : bad+= 1
+    else : data[ix]= d
+  return (data,bad)
+
+
+# Decodes one track of GCR bytes for track tix, returns the sectors as a dict six -> (data,error), error is None or a string
+def g64_decode_track(gcr,tix) :
+  numbits= 8*len(gcr)
+  bits= format(int.from_bytes(gcr,'big'),f"0{numbits}b")
+  bits+= bits[:(10+20+325)*8] # the track is a circle: header, gap and data block may wrap around the end
+  sectors= {}
+  header= None # (six,error) of last header that has not yet seen its data block
+  pos= 0
+  while True :
+    pos= bits.find("1111111111",pos)
+    if pos<0 or (pos>=numbits and header==None) : break # past the end only to finish a wrapped sector
+    pos= bits.find("0",pos) # first bit after sync
+    if pos<0 : break
+    (kind,bad)= gcr_decode(bits,pos,1)
+    if kind==None : break
+    if kind[0]==0x08 :
+      (hdr,bad)= gcr_decode(bits,pos,8)
+      if hdr==None : break
+      six= hdr[2]
+      error= None
+      if bad>0 : error= "header gcr error"
+      elif hdr[1]!=hdr[2]^hdr[3]^hdr[4]^hdr[5] : error= "header checksum error"
+      elif hdr[3]!=tix : error= f"header has track {hdr[3]}"
+      if six<SECTORSPERTRACK[tix] and six not in sectors : header= (six,error)
+      else : header= None
+      pos+= 80
+    elif kind[0]==0x07 :
+      if header!=None :
+        (six,error)= header
+        (blk,bad)= gcr_decode(bits,pos,260)
+        if blk==None : break
+        data= bytes(blk[1:257])
+        if error==None :
+          if bad>0 : error= "data gcr error"
+          elif functools.reduce(operator.xor,data,0)!=blk[257] : error= "data checksum error"
+        sectors[six]= (data,error)
+        header= None
+      pos+= 2600
+    else :
+      pos+= 10
+  return sectors
+
+
+# Decodes G64 file `content` into the bytes of a d64 (BLOCKSPERDISK*BYTESPERBLOCK bytes),
+# and a dict bix -> error (string) for blocks that could not be decoded correctly (missing blocks are zero)
+def g64_decode(content) :
+  if content[0:8]!=G64SIGNATURE : raise ValueError("not a G64 file (signature)")
+  numhalftracks= content[9]
+  d64= bytearray(BLOCKSPERDISK*BYTESPERBLOCK)
+  errors= {}
+  for tix in range(1,len(SECTORSPERTRACK)-1) :
+    hix= 2*(tix-1) # half track index
+    ofs= int.from_bytes(content[12+4*hix:12+4*hix+4],'little') if hix<numhalftracks else 0
+    if ofs==0 or ofs+2>len(content) : 
+      sectors= {}
+    else :
+      size= int.from_bytes(content[ofs:ofs+2],'little')
+      sectors= g64_decode_track(content[ofs+2:ofs+2+size],tix)
+    for six in range(SECTORSPERTRACK[tix]) :
+      bix= TRACKSTART[tix]+six
+      if six not in sectors :
+        errors[bix]= "sector not found"
+        continue
+      (data,error)= sectors[six]
+      d64[bix*BYTESPERBLOCK:(bix+1)*BYTESPERBLOCK]= data
+      if error!=None : errors[bix]= error
+  return (bytes(d64),errors)
+
+
+#endregion
+#region ### WRITER ##################################################################
+
+
+FILETYPES = {'DEL':0b000, 'SEQ':0b001, 'PRG':0b010, 'USR':0b011, 'REL':0b100} # low bits of the filetype byte of a directory entry
+
+
+class D64Writer :
+
+  # Writes files into a d64 image that is held in a writable buffer (bytearray or mmap of the image file).
+  # The BAM is decoded once, into one bit set per track (bit six set means sector six is free, 
+  # as print_bamtech shows it). Blocks are allocated from these bit sets, so adding a file never 
+  # rescans the BAM. Only `flush` encodes the bit sets back into the BAM (and flushes an mmap).
+  # So a batch of `put`s costs a single flush.
+
+  # Allocation follows the 1541 rules
+  # - file blocks are never on track 18 (directory track)
+  # - the first block of a file is on the track closest to track 18 that has a free sector
+  # - next blocks are `interleave` sectors further on the same track (default 10, or per track), 
+  #   when the track is full the next track further away from track 18 is used, 
+  #   and when that side of the disk is full, the other side
+  # - directory blocks are on track 18, with an interleave of 3, chained from 18/1
+  # With `contiguous` files are kept together: a file starts on a track with room for all its blocks,
+  # and `trackskip` extra sectors are skipped when a file moves to the next track (for the head step).
+
+  #    + buf:bytearray|mmap=the BLOCKSPERDISK*BYTESPERBLOCK bytes of the d64 image
+  #    + interleave:int|list=sector distance between consecutive blocks of a file (or a list with that per track)
+  #    + contiguous:bool=start files on a track with room for the whole file
+  #    + trackskip:int=extra sector distance when the next block is on another track
+  def __init__(self,buf,interleave=10,contiguous=False,trackskip=0) :
+    if len(buf)!=BLOCKSPERDISK*BYTESPERBLOCK : raise ValueError(f"image must have {BLOCKSPERDISK} blocks")
+    self.buf= buf
+    self.interleave= [interleave]*len(SECTORSPERTRACK) if isinstance(interleave,int) else list(interleave)
+    self.contiguous= contiguous
+    self.trackskip= trackskip
+    bam= TRACKSTART[18]*BYTESPERBLOCK
+    # Decode BAM into bit sets
+    self.free= [0]*len(SECTORSPERTRACK) 
+    for tix in range(1,len(SECTORSPERTRACK)-1) :
+      ofs= bam+4*tix
+      self.free[tix]= (buf[ofs+1] | buf[ofs+2]<<8 | buf[ofs+3]<<16) & ((1<<SECTORSPERTRACK[tix])-1)
+    self.nfree= sum( bin(self.free[tix]).count('1') for tix in range(1,len(SECTORSPERTRACK)-1) if tix!=18 )
+    # Walk the directory once: collect its blocks and names, and find the first free entry
+    self.dirbixs= []
+    self.names= set()
+    self.slot= None # (index in dirbixs, offset of entry in block) of first free directory entry
+    visited= bytearray(BLOCKSPERDISK)
+    tix,six= 18,1
+    while tix==18 and 0<=six<SECTORSPERTRACK[18] and not visited[TRACKSTART[18]+six] :
+      bix= TRACKSTART[18]+six
+      visited[bix]= 1
+      self.dirbixs.append(bix)
+      for eix in range(0,BYTESPERBLOCK,32) :
+        ofs= bix*BYTESPERBLOCK+eix
+        if buf[ofs+0x02]==0x00 : # never used or scratched
+          if self.slot==None : self.slot= (len(self.dirbixs)-1,eix)
+        else :
+          self.names.add( bytes(buf[ofs+0x05:ofs+0x14+1]) )
+      tix,six= buf[bix*BYTESPERBLOCK+0x00],buf[bix*BYTESPERBLOCK+0x01]
+
+  # Returns the first free sector on track `tix` at or after sector `six` (wrapping around), or None when the track is full
+  def _free_on_track(self,tix,six) :
+    bits= self.free[tix]
+    if bits==0 : return None
+    num= SECTORSPERTRACK[tix]
+    six%= num
+    rot= ((bits>>six) | (bits<<(num-six))) & ((1<<num)-1) # rotate so that sector six is bit 0
+    return (six+(rot & -rot).bit_length()-1) % num
+
+  # Marks sector six on track tix as used, returns its block index
+  def _take(self,tix,six) :
+    self.free[tix]&= ~(1<<six)
+    if tix!=18 : self.nfree-= 1
+    return TRACKSTART[tix]+six
+
+  # Marks the blocks `bixs` as free again (undoes _take)
+  def _release(self,bixs) :
+    for bix in bixs :
+      (tix,six)= bix2ts(bix)
+      self.free[tix]|= 1<<six
+      if tix!=18 : self.nfree+= 1
+
+  # Allocates the first block of a file of `num` blocks, returns (tix,six)
+  # When contiguous, a track is preferred that can hold the whole file (or that is empty, for files larger than a track)
+  def _alloc_first(self,num=1) :
+    tracks= [tix for dist in range(1,len(SECTORSPERTRACK)-2) for tix in (18-dist,18+dist) if 1<=tix<len(SECTORSPERTRACK)-1]
+    if self.contiguous :
+      for tix in tracks :
+        free= bin(self.free[tix]).count('1')
+        if free>=min(num,SECTORSPERTRACK[tix]) : 
+          return tix,self._take(tix,self._free_on_track(tix,0))-TRACKSTART[tix]
+    for tix in tracks :
+      if self.free[tix] : 
+        return tix,self._take(tix,self._free_on_track(tix,0))-TRACKSTART[tix]
+    raise ValueError("disk full")
+
+  # Allocates the block following (tix,six) in a file, returns (tix,six)
+  def _alloc_next(self,tix,six) :
+    step= -1 if tix<18 else +1
+    tracks= itertools.chain( [tix], range(tix+step,0,-1) if step<0 else range(tix+step,len(SECTORSPERTRACK)-1), 
+                                    range(19,len(SECTORSPERTRACK)-1) if step<0 else range(17,0,-1) )
+    for t in tracks :
+      s= self._free_on_track(t,six+self.interleave[t]+(0 if t==tix else self.trackskip))
+      if s!=None :
+        self._take(t,s)
+        return t,s
+    raise ValueError("disk full")
+
+  # Returns the offset in buf of a free directory entry (extending the directory chain on track 18 when needed)
+  def _dir_slot(self) :
+    if self.slot==None :
+      last= self.dirbixs[-1]
+      six= self._free_on_track(18,last-TRACKSTART[18]+3)
+      if six==None : raise ValueError("directory full")
+      bix= self._take(18,six)
+      ofs= bix*BYTESPERBLOCK
+      self.buf[ofs:ofs+BYTESPERBLOCK]= bytes(BYTESPERBLOCK)
+      self.buf[ofs+0x01]= 0xFF
+      self.buf[last*BYTESPERBLOCK+0x00]= 18
+      self.buf[last*BYTESPERBLOCK+0x01]= six
+      self.dirbixs.append(bix)
+      self.slot= (len(self.dirbixs)-1,0)
+    dix,eix= self.slot
+    ofs= self.dirbixs[dix]*BYTESPERBLOCK+eix
+    # Advance to next free entry (only forward, so all puts together scan the directory once)
+    self.slot= None
+    while True :
+      eix+= 32
+      if eix==BYTESPERBLOCK : dix,eix= dix+1,0
+      if dix==len(self.dirbixs) : break
+      if self.buf[self.dirbixs[dix]*BYTESPERBLOCK+eix+0x02]==0x00 :
+        self.slot= (dix,eix)
+        break
+    return ofs
+
+  # Writes `data` as a chain of blocks, returns the list of block indices
+  def write_chain(self,data) :
+    num= max(1,(len(data)+BYTESPERBLOCK-3)//(BYTESPERBLOCK-2))
+    if num>self.nfree : raise ValueError(f"disk full ({num} blocks needed, {self.nfree} free)")
+    tsl= [self._alloc_first(num)]
+    while len(tsl)<num : tsl.append( self._alloc_next(*tsl[-1]) )
+    for ix,(tix,six) in enumerate(tsl) :
+      ofs= (TRACKSTART[tix]+six)*BYTESPERBLOCK
+      chunk= data[ix*(BYTESPERBLOCK-2):(ix+1)*(BYTESPERBLOCK-2)]
+      if ix+1<num : link= bytes(tsl[ix+1])
+      else : link= bytes( (0x00,len(chunk)+1) )
+      self.buf[ofs:ofs+BYTESPERBLOCK]= link + chunk + bytes(BYTESPERBLOCK-2-len(chunk))
+    return [TRACKSTART[tix]+six for tix,six in tsl]
+
+  # Adds a file with name `fname` (str, max 16 chars), content `data` (for PRG including load address) and filetype `ftype` (key of FILETYPES)
+  def put(self,fname,data,ftype='PRG') :
+    name= fname.upper().encode('ascii','replace')
+    if len(name)>16 : raise ValueError(f"filename '{fname}' longer than 16 chars")
+    name+= b"\xA0"*(16-len(name))
+    return self.put_entry( bytes( (0x80|FILETYPES[ftype],0,0) ) + name + bytes(11), data )
+
+  # Adds a file with directory entry `entry` (the 30 bytes at offset 02..1F of a directory slot) and content `data`.
+  # The block1 t/s-link and the size in the entry are filled in, all other fields are kept.
+  # `nextra` blocks written separately (GEOS info block and records) are counted in the size.
+  # The chain is written before a directory slot is taken, so a full disk leaves the directory untouched.
+  def put_entry(self,entry,data,nextra=0) :
+    name= bytes(entry[0x03:0x13])
+    if name in self.names : raise ValueError(f"file '{filename2str(name)}' exists")
+    bixs= self.write_chain(data)
+    try :
+      ofs= self._dir_slot()
+    except ValueError :
+      self._release(bixs)
+      raise
+    self.buf[ofs+0x02:ofs+0x20]= entry[0:1] + bytes(bix2ts(bixs[0])) + entry[3:28] + (len(bixs)+nextra).to_bytes(2,'little')
+    self.names.add(name)
+    return bixs
+
+  # Encodes the bit sets back into the BAM (bit set and free count per track) and flushes the buffer if it is an mmap
+  def flush(self) :
+    bam= TRACKSTART[18]*BYTESPERBLOCK
+    for tix in range(1,len(SECTORSPERTRACK)-1) :
+      ofs= bam+4*tix
+      bits= self.free[tix]
+      self.buf[ofs:ofs+4]= bytes( (bin(bits).count('1'), bits&0xFF, (bits>>8)&0xFF, (bits>>16)&0xFF) )
+    if hasattr(self.buf,'flush') : self.buf.flush()
+
+
+# Formats the d64 image in `buf`: all blocks zero, except the BAM and the first directory block (18/1).
+# The header fields of the BAM (dos version, diskname, diskid, dostype) are copied from `bamdata`.
+def d64_format(buf,bamdata) :
+  buf[0:len(buf)]= bytes(len(buf))
+  bam= TRACKSTART[18]*BYTESPERBLOCK
+  buf[bam:bam+BYTESPERBLOCK]= bamdata
+  buf[bam+0x00:bam+0x02]= bytes( (18,1) )
+  for tix in range(1,len(SECTORSPERTRACK)-1) :
+    bits= (1<<SECTORSPERTRACK[tix])-1
+    if tix==18 : bits&= ~0b11 # BAM and first directory block
+    buf[bam+4*tix:bam+4*tix+4]= bytes( (bin(bits).count('1'), bits&0xFF, (bits>>8)&0xFF, (bits>>16)&0xFF) )
+  dir1= (TRACKSTART[18]+1)*BYTESPERBLOCK
+  buf[dir1+0x01]= 0xFF
+
+
+# Returns the content of the file starting at block bix in the d64 image `buf` (follows t/s-links in the raw bytes)
+def d64_tobin(buf,bix) :
+  bins= []
+  visited= bytearray(BLOCKSPERDISK)
+  while bix!=None and not visited[bix] :
+    visited[bix]= 1
+    ofs= bix*BYTESPERBLOCK
+    (tix,six)= (buf[ofs+0x00],buf[ofs+0x01])
+    if tix==0x00 :
+      bins.append( bytes(buf[ofs+0x02:ofs+six+1]) )
+      break
+    bins.append( bytes(buf[ofs+0x02:ofs+BYTESPERBLOCK]) )
+    bix= TRACKSTART[tix]+six if 1<=tix<len(SECTORSPERTRACK)-1 and six<SECTORSPERTRACK[tix] else None
+  return b''.join(bins)
+
+
+# Returns the sha1 of a file in d64 image `buf`: of the chain from `bix1` and, for GEOS, of the info block at `infobix`
+# and (`isvlir`) of the chain of every record in the record index at `bix1`. The index itself is not hashed, since 
+# its t/s-links change when the records move; the number of records and the length of each part are hashed.
+def d64_filehash(buf,bix1,infobix=None,isvlir=False) :
+  parts= [ b"" if bix1==None or isvlir else d64_tobin(buf,bix1) ]
+  if infobix!=None : parts.append( d64_tobin(buf,infobix) )
+  if isvlir and bix1!=None :
+    index= bytes(buf[bix1*BYTESPERBLOCK:(bix1+1)*BYTESPERBLOCK])
+    for rix in range(GEOSRECORDS) :
+      (tix,six)= index[2+2*rix:4+2*rix]
+      if tix==0x00 and six==0x00 : break
+      valid= 1<=tix<len(SECTORSPERTRACK)-1 and six<SECTORSPERTRACK[tix]
+      parts.append( d64_tobin(buf,TRACKSTART[tix]+six) if valid else b"(empty)" )
+  sha1= hashlib.sha1()
+  for part in parts : sha1.update( len(part).to_bytes(4,'little')+part )
+  return sha1.hexdigest()
+
+
+# Returns (tix,six), the track and sector index of block index bix
+def bix2ts(bix) :
+  tix= bisect.bisect_right(TRACKSTART,bix,1,len(SECTORSPERTRACK)-1)-1
+  return (tix,bix-TRACKSTART[tix])
+
+
+#endregion
+#region ### FRAGMENTATION ###########################################################
+
+
+FRAGRATIO=20 # A file with a fragmentation score (0..100) above this is flagged as fragmented
+
+
+# Returns the number of tracks a file of `num` blocks needs when stored contiguously, starting at track tix
+def min_tracks(num,tix) :
+  step= -1 if tix<18 else +1
+  tracks= 0
+  while num>0 and 1<=tix<len(SECTORSPERTRACK)-1 :
+    if tix!=18 : 
+      num-= SECTORSPERTRACK[tix]
+      tracks+= 1
+    tix+= step
+  return max(1,tracks)
+
+
+# Returns a dict scoring the fragmentation of `chain` (list of Block's of one file): 
+# number of tracks, track changes, jumps (skipping tracks, or reversing direction), and a score 0 (contiguous) .. 100
+def fragmentation(chain) :
+  changes= 0
+  jumps= 0
+  direction= 0
+  for prev,block in zip(chain,chain[1:]) :
+    if block.tix==prev.tix : continue
+    changes+= 1
+    step= block.tix-prev.tix
+    if abs(step)>1 or step*direction<0 : jumps+= 1
+    direction= step
+  extra= max(0,changes-(min_tracks(len(chain),chain[0].tix)-1))
+  score= min(100,round(100*(extra+jumps)/max(1,len(chain)-1)))
+  return { 'blocks':len(chain), 'tracks':len({block.tix for block in chain}), 'changes':changes, 'jumps':jumps, 'score':score }
+
+
+# Generates a fragmentation record per file of the current disk
+def gen_fragrecords(proctime=BLOCKPROCESSTIME) :
+  for entry in iter_dir() :
+    record= {'record':"frag", 'name':entry.fname, 'block1':entry.block1}
+    if entry.block1!=None :
+      block1= blocks[entry.block1]
+      frag= fragmentation([b for nexts,b in block1.chain()])
+      load= loadtime_summary(block1,proctime)
+      record.update(frag)
+      record.update( {'interleave':round(100*load['ideal']/load['time']), 'fragmented':frag['score']>FRAGRATIO, 'slow':load['slow']} )
+    yield record
+
+
+# Generator of the lines of the fragmentation table for all files of the current disk
+def gen_fraghuman(with_header=True,proctime=BLOCKPROCESSTIME) :
+  linesep= "|--------------------|--------|--------|---------|-------|------|-----------|------|"
+  if with_header :
+    yield "| filename           | blocks | tracks | changes | jumps | frag | interleave| flag |"
+    yield linesep
+  nfrag= 0
+  nslow= 0
+  for entry in iter_dir() :
+    fname= "'"+entry.fname+"'"
+    if entry.block1==None :
+      yield f"| {fname:<18s} | {'no first block':<59} |"
+      continue
+    block1= blocks[entry.block1]
+    chain= [b for nexts,b in block1.chain()]
+    frag= fragmentation(chain)
+    load= loadtime_summary(block1,proctime)
+    quality= round(100*load['ideal']/load['time'])
+    flag= ('F' if frag['score']>FRAGRATIO else ' ') + ('S' if load['slow'] else ' ')
+    if frag['score']>FRAGRATIO : nfrag+= 1
+    if load['slow'] : nslow+= 1
+    yield f"| {fname:<18s} | {frag['blocks']:^6} | {frag['tracks']:^6} | {frag['changes']:^7} | {frag['jumps']:^5} | {frag['score']:3}% | {quality:8}% | {flag:^4} |"
+  if with_header : yield linesep
+  yield f"{nfrag} fragmented (F), {nslow} badly interleaved (S); --arelayout writes a disk with all files contiguous at best interleave"
+
+
+# Writes the files of the current disk (`blocks`) into `buf` (a bytearray, formatted here), 
+# each file contiguous and at the best skip per track. Directory entries (except block1 and size) and BAM header are kept.
+# A GEOS file keeps its info block and VLIR records: they are written first, and their t/s-links rewritten.
+# Generates (fname,hash before,hash after) per file, so that the caller can verify the contents are identical.
+def relayout(buf,proctime=BLOCKPROCESSTIME) :
+  old= b"".join(block.data for block in blocks)
+  d64_format(buf,blocks[TRACKSTART[18]].data)
+  skips= [best_skip(tix,proctime) if SECTORSPERTRACK[tix]>0 else 0 for tix in range(len(SECTORSPERTRACK))]
+  trackskip= math.ceil(STEPTIME/(60/RPM/max(SECTORSPERTRACK))) # sectors passing during one head step
+  writer= D64Writer(buf,skips,contiguous=True,trackskip=trackskip)
+  for entry in iter_dir() :
+    fname= entry.fname
+    if entry.rawtype & 0b111 == FILETYPES['REL'] : raise ValueError(f"file '{fname}' is REL, side sectors can not be relayouted")
+    raw= bytearray(entry.block.data[entry.eix+0x02:entry.eix+0x20])
+    data= b"" if entry.block1==None else blocks[entry.block1].tobin()
+    info= geos_info(entry)
+    (infobix,newinfobix,nextra)= (None,None,0)
+    if info!=None : # info block t/s is at 15-16 in the directory slot, so at 13-14 in raw
+      infobix= info['block']
+      newinfobix= writer.write_chain(blocks[infobix].data[0x02:])[0]
+      raw[0x13:0x15]= bytes(bix2ts(newinfobix))
+      nextra+= 1
+    isvlir= entry.isvlir() and entry.block1!=None
+    if isvlir : # write the records, then the index with their new t/s
+      index= bytearray(blocks[entry.block1].data[0x02:])
+      for rix,chain in enumerate(geos_records(blocks[entry.block1])) :
+        if chain==None : continue
+        bixs= writer.write_chain( chain2bin(blocks[bix] for bix in chain) )
+        index[2*rix:2*rix+2]= bytes(bix2ts(bixs[0]))
+        nextra+= len(bixs)
+      data= bytes(index)
+    bixs= writer.put_entry(raw,data,nextra)
+    yield (fname,d64_filehash(old,entry.block1,infobix,isvlir),d64_filehash(buf,bixs[0],newinfobix,isvlir))
+  writer.flush()
+
+
+#endregion
+#region ### RECOVERY ################################################################
+
+
+LOSTFORMATTED= bytes((0x4B,))+bytes((0x01,))*(BYTESPERBLOCK-1) # a sector as the 1541 formats it (never written)
+
+
+# Returns True iff block `data` was never written: all 00 (e.g. a fresh image), or as the 1541 formats it
+def block_isunused(data) :
+  return block_isempty(data) or data==LOSTFORMATTED
+
+
+# Returns (succ,preds) of the t/s-link graph of the current disk (`blocks`), built in one pass.
+# succ[bix] is the block the link of bix points to (None for a last block or a broken link),
+# preds[bix] is the list of blocks linking to bix.
+def link_graph() :
+  succ= [None]*len(blocks)
+  preds= [[] for block in blocks]
+  for block in blocks :
+    if block.data[0x00]==0x00 : continue
+    nxt= block_find(block.data[0x00],block.data[0x01])
+    if nxt==None : continue
+    succ[block.bix]= nxt.bix
+    preds[nxt.bix].append(block.bix)
+  return (succ,preds)
+
+
+# Returns a bytearray with a 1 for every live block: BAM, directory chain, and all blocks of non-DEL entries (also GEOS records)
+def live_blocks() :
+  live= bytearray(len(blocks))
+  live[TRACKSTART[18]]= 1
+  for nexts,block in blocks[TRACKSTART[18]+1].chain() : live[block.bix]= 1
+  for entry in iter_dir() :
+    for (tix,six) in ((entry.tix,entry.six),(entry.sstix,entry.sssix)) : # first data block, REL side sector (GEOS info block)
+      block1= block_find(tix,six)
+      if block1==None : continue
+      for nexts,b in block1.chain() : live[b.bix]= 1
+    if entry.isvlir() and entry.block1!=None : 
+      for chain in geos_records(blocks[entry.block1]) :
+        for bix in chain or [] : live[bix]= 1
+  return live
+
+
+# Returns (chain,end): the bixs from `bix` following `succ` and the reason the chain ends 
+# ("ok", "broken link", "loop", "live block", "claimed block": in the chain of an earlier candidate, see `claimed`)
+def lost_chain(bix,succ,live,claimed) :
+  chain= []
+  visited= bytearray(len(blocks))
+  while True :
+    if live[bix] : return (chain,"live block")
+    if claimed[bix] : return (chain,"claimed block")
+    if visited[bix] : return (chain,"loop")
+    visited[bix]= 1
+    chain.append(bix)
+    if blocks[bix].data[0x00]==0x00 : return (chain,"ok" if blocks[bix].data[0x01]>=0x02 else "empty last block")
+    if succ[bix]==None : return (chain,"broken link")
+    bix= succ[bix]
+
+
+# Returns the plausibility score (0..100) of a candidate, see help_lost()
+def lost_score(cand) :
+  score= {"ok":40,"live block":10,"claimed block":10}.get(cand['end'],0)
+  data= blocks[cand['chain'][0]].data
+  addr= data[0x02]+256*data[0x03]
+  if 0x0400<=addr<0xD000 : score+= 15
+  if addr==0x0801 :
+    nextaddr= data[0x04]+256*data[0x05]
+    if nextaddr==0 or 0x0801+4<nextaddr<0x0801+254*len(cand['chain']) : score+= 15
+  if cand['source']=="scratched" : 
+    score+= 15
+    if cand['size']==len(cand['chain']) : score+= 10
+  if len(cand['chain'])>1 : score+= 5
+  return score
+
+
+# Returns the recovery candidates of the current disk, most plausible first.
+# Each is a dict with source ("scratched" or "orphan"), fname, size (entry blocks, None for orphans), chain (bixs), end, score
+def lost_candidates() :
+  (succ,preds)= link_graph()
+  live= live_blocks()
+  cands= []
+  claimed= bytearray(len(blocks))
+  for entry in iter_dir(with_deleted=True) :
+    if not entry.isdeleted() or entry.rawname[0] in (0x00,0xA0) : continue # live entry or unused slot
+    if entry.block1==None or live[entry.block1] : continue # chain gone or overwritten by a live file
+    if claimed[entry.block1] : continue # same chain as an earlier scratched entry
+    (chain,end)= lost_chain(entry.block1,succ,live,claimed)
+    cands.append( {'source':"scratched",'fname':entry.fname,'size':entry.size,'chain':chain,'end':end} )
+    for bix in chain : claimed[bix]= 1
+  for block in blocks :
+    bix= block.bix
+    if live[bix] or claimed[bix] or len(preds[bix])>0 or block_isunused(block.data) : continue
+    (chain,end)= lost_chain(bix,succ,live,claimed)
+    if len(chain)==1 and end=="broken link" : continue # a lone block with an invalid link is debris, not a file
+    fname= f"orphan {block.tix}/{block.six}"
+    cands.append( {'source':"orphan",'fname':fname,'size':None,'chain':chain,'end':end} )
+    for bix in chain : claimed[bix]= 1
+  for cand in cands : cand['score']= lost_score(cand)
+  cands.sort(key=lambda cand:cand['score'],reverse=True)
+  return cands
+
+
+# Returns a host file name for candidate `cand` with `rank`
+def lost_hostname(rank,cand) :
+  name= ''.join( ch if ch.isalnum() or ch in "-_" else "_" for ch in cand['fname'] )
+  data= blocks[cand['chain'][0]].data
+  ext= "prg" if 0x0400<=data[0x02]+256*data[0x03]<0xD000 else "bin"
+  return f"{rank:02d}-{name}.{ext}"
+
+
+# Generates a record per recovery candidate in `cands` (see lost_candidates)
+def gen_lostrecords(cands) :
+  for rank,cand in enumerate(cands,1) :
+    yield {'record':"lost", 'rank':rank, 'score':cand['score'], 'source':cand['source'], 'name':cand['fname'], 'size':cand['size'], 
+           'chain':cand['chain'], 'end':cand['end'], 'hostname':lost_hostname(rank,cand)}
+
+
+# Generator of the lines of the recovery table for the current disk
+def gen_losthuman(cands,with_header=True) :
+  linesep= "|------|-------|-----------|--------------------|-----------|--------|------------------|"
+  if with_header :
+    yield "| rank | score | source    | filename           | block1    | blocks | chain end        |"
+    yield linesep
+  for rank,cand in enumerate(cands,1) :
+    fname= "'"+cand['fname']+"'"
+    bix= cand['chain'][0]
+    (tix,six)= bix2ts(bix)
+    size= f"{len(cand['chain'])}" if cand['size']==None else f"{len(cand['chain'])}/{cand['size']}"
+    yield f"| {rank:^4} | {cand['score']:^5} | {cand['source']:<9} | {fname:<18s} | {tix:02}/{six:02}={bix:03} | {size:^6} | {cand['end']:<16} |"
+  if with_header : yield linesep
+  yield f"{len(cands)} recovery candidates; --tlost rank views one, --msave dir extracts all"
+
+
+#endregion
+#region ### GEOS ####################################################################
+
+# GEOS marks a disk with a signature in the BAM (at AD), and uses otherwise unused bytes of a directory entry:
+#   15-16: t/s of the info block (REL side sector otherwise)
+#   17   : structure, 00 sequential or 01 VLIR (REL record length otherwise)
+#   18   : GEOS file type (00 is a plain C64 file), 19-1D the date (year, month, day, hour, minute)
+# The info block (one block, link 00 FF) has the icon, load/end/start address, class, author and description.
+# A VLIR file has up to 127 records. Its first block is the record index (link 00 FF): a t/s per record, 
+# where 00/00 ends the list, 00/FF is an empty record, and anything else is the first block of the record's chain.
+# http://unusedino.de/ec64/technical/formats/geos.html
+GEOSSIGNATURE = b"GEOS format"
+GEOSTYPES     = [ "non-GEOS", "BASIC", "assembler", "data", "system", "desk accessory", "application", "application data",
+                  "font", "printer driver", "input driver", "disk driver", "system boot", "temporary", "auto-exec", "input 128" ]
+GEOSINFO      = struct.Struct('<BB3s63sBBBHHH20s20s20s23s96s') # link, id, icon, c64 type, geos type, structure, load, end, start, class, author, parent, free, description
+GEOSRECORDS   = 127
+
+
+def geos_typename(geostype) :
+  return GEOSTYPES[geostype] if geostype<len(GEOSTYPES) else f"type {geostype}"
+
+
+# Returns the GEOS format string in the BAM (e.g. "GEOS format V1.0"), None if the current disk is not a GEOS disk
+def geos_format() :
+  sig= bytes(blocks[TRACKSTART[18]].data[0xAD:0xBD])
+  if not sig.startswith(GEOSSIGNATURE) : return None
+  return sig.partition(b"\0")[0].decode("ascii","replace")
+
+
+# Returns the date in GEOS `entry` as "yyyy-mm-dd hh:mm"
+def geos_date(entry) :
+  (year,month,day,hour,minute)= entry.rawgeos[1:6]
+  return f"{year+(1900 if year>=80 else 2000):04}-{month:02}-{day:02} {hour:02}:{minute:02}"
+
+
+# Returns the info block of GEOS `entry` unpacked in a dict, None when the entry has no info block
+def geos_info(entry) :
+  block= block_find(entry.sstix,entry.sssix) if entry.geostype!=0 else None
+  if block==None : return None
+  (_,_,_,_,c64type,geostype,structure,load,end,start,cls,author,parent,_,descr)= GEOSINFO.unpack(block.data)
+  text= lambda raw : raw.partition(b"\0")[0].decode("ascii","replace") # GEOS strings are ascii
+  return {'block':block.bix, 'geostype':geostype, 'structure':structure, 'load':load, 'end':end, 'start':start, 
+          'class':text(cls), 'author':text(author), 'parent':text(parent), 'description':text(descr)}
+
+
+# Returns the t/s of record `rix` in VLIR record index block `index`: None past the end of the list, (0,255) if empty
+def geos_recordts(index,rix) :
+  (tix,six)= index.data[2+2*rix:4+2*rix]
+  return None if tix==0x00 and six==0x00 else (tix,six)
+
+
+# Returns the records of the VLIR file with record index block `index`: per record the bixs of its chain, 
+# or None for an empty record (or one whose t/s is not on the disk)
+def geos_records(index) :
+  records= []
+  for rix in range(GEOSRECORDS) :
+    ts= geos_recordts(index,rix)
+    if ts==None : break
+    block1= block_find(*ts)
+    records.append( None if block1==None else [block.bix for nexts,block in block1.chain()] )
+  return records
+
+
+# Returns the bix of the first block of record `rix` of VLIR file `entry`, jumping straight to it via the index; raises ValueError
+def geos_record1(entry,rix) :
+  if not entry.isvlir() or entry.block1==None : raise ValueError(f"'{entry.fname}' is not a GEOS VLIR file")
+  index= blocks[entry.block1]
+  ts= geos_recordts(index,rix) if 0<=rix<GEOSRECORDS else None
+  if ts==None : raise ValueError(f"'{entry.fname}' has no record {rix}")
+  block1= block_find(*ts)
+  if block1==None : raise ValueError(f"record {rix} of '{entry.fname}' is empty")
+  return block1.bix
+
+
+# Generates a record per GEOS file in `entries`, followed by a record per VLIR record when `with_records`
+def gen_geosrecords(entries,with_records=False) :
+  for entry in entries :
+    yield {'record':"geosfile", 'name':entry.fname, 'geostype':geos_typename(entry.geostype), 'structure':"VLIR" if entry.isvlir() else "SEQ",
+           'date':geos_date(entry), 'blocks':entry.size, 'block1':entry.block1, 'info':geos_info(entry)}
+    if with_records and entry.isvlir() and entry.block1!=None :
+      for rix,chain in enumerate(geos_records(blocks[entry.block1])) :
+        yield {'record':"geosrecord", 'name':entry.fname, 'index':rix, 'chain':chain, 
+               'size':None if chain==None else len(chain2bin(blocks[bix] for bix in chain))}
+
+
+# Generates the lines of the GEOS view: a table of the GEOS files in `entries`, with `with_records` 
+# followed by the info block and the VLIR records of each
+def gen_geoshuman(entries,with_header=True,with_records=False) :
+  fmt= geos_format()
+  yield f"disk is {'a GEOS disk ('+fmt+')' if fmt!=None else 'not a GEOS disk (no GEOS signature in the BAM)'}"
+  yield ""
+  filesep= "|--------------------|------------------|-----------|--------|------------------|-----------|----------------------|"
+  recsep=  "|--------|-----------|--------|--------|"
+  if with_header :
+    yield  "| filename           | GEOS type        | structure | blocks | date             | info      | class                |"
+    yield filesep
+  for record in gen_geosrecords(entries,with_records) :
+    if record['record']=="geosfile" :
+      info= record['info']
+      fname= "'"+record['name']+"'"
+      infots= "none" if info==None else "{:02}/{:02}={:03}".format(*bix2ts(info['block']),info['block'])
+      yield f"| {fname:<18s} | {record['geostype']:<16s} | {record['structure']:^9s} | {record['blocks']:^6} | {record['date']} | {infots} | {'' if info==None else info['class']:<20s} |"
+      if with_records and info!=None :
+        yield f"author {info['author']!r}, parent application {info['parent']!r}"
+        yield f"load {info['load']:04X}, end {info['end']:04X}, start {info['start']:04X}"
+        yield f"description {info['description']!r}"
+      if with_records and record['structure']=="VLIR" :
+        yield ""
+        yield "| record | block1    | blocks | bytes  |"
+        yield recsep
+    else :
+      chain= record['chain']
+      if chain==None :
+        yield f"| {record['index']:^6} | {'empty':^9} |        |        |"
+      else :
+        yield "| {:^6} | {:02}/{:02}={:03} | {:^6} | {:^6} |".format(record['index'],*bix2ts(chain[0]),chain[0],len(chain),record['size'])
+  if with_records and len(entries)==1 and entries[0].isvlir() : yield recsep
+  elif with_header : yield filesep
+  yield f"{len(entries)} GEOS files; --tgeos filename shows one with its records, --mrecord N views record N"
+
+
+# Writes the info block and all records of GEOS `entry` in new directory `dirname` (one pass over the record index)
+def geos_save(entry,dirname) :
+  os.makedirs(dirname)
+  names= []
+  info= geos_info(entry)
+  if info!=None :
+    names.append("info.bin")
+    with open(os.path.join(dirname,names[-1]), mode='wb') as file : file.write( blocks[info['block']].data[2:] )
+  chains= geos_records(blocks[entry.block1]) if entry.isvlir() else [ [block.bix for nexts,block in blocks[entry.block1].chain()] ]
+  for rix,chain in enumerate(chains) :
+    if chain==None : continue
+    names.append(f"record-{rix:03}.bin")
+    with open(os.path.join(dirname,names[-1]), mode='wb') as file : file.write( chain2bin(blocks[bix] for bix in chain) )
+  return names
+
+
+#endregion
+#region ### MEMORY MAP ##############################################################
+
+# The C64 memory areas a PRG can load into. Loading into a conflict area clobbers the system (zero page, stack, 
+# OS work area), lands in RAM under a ROM that must be banked out, or writes the IO registers.
+# The BASIC area is a conflict for a file that does not load at 0801 (it clobbers the BASIC program or its variables).
+MEMAREAS = [ # (first, last, name, conflict)
+  (0x0000, 0x00FF, "zero page" , True ),
+  (0x0100, 0x01FF, "stack"     , True ),
+  (0x0200, 0x03FF, "OS work"   , True ),
+  (0x0400, 0x07FF, "screen"    , False),
+  (0x0800, 0x9FFF, "BASIC"     , True ),
+  (0xA000, 0xBFFF, "BASIC ROM" , True ),
+  (0xC000, 0xCFFF, "RAM"       , False),
+  (0xD000, 0xDFFF, "IO"        , True ),
+  (0xE000, 0xFFFF, "KERNAL ROM", True ),
+]
+MEMBASIC = 0x0801 # load address of a BASIC program
+
+
+# Returns the names of the MEMAREAS that [load,end) touches, a conflicting area gets a "!".
+# BASIC is only a conflict for a file (`isfile`) that does not load at 0801.
+def mem_areas(load,end,isfile=True) :
+  names= []
+  for (first,last,name,conflict) in MEMAREAS :
+    if load<=last and end>first :
+      if name=="BASIC" : conflict= isfile and load!=MEMBASIC
+      names.append( name+"!" if conflict else name )
+  return names
+
+
+# Returns a dict per PRG of the current disk (`blocks`): name, load address, end address (exclusive) and size.
+# One directory pass; the size comes from following the chain (only the link bytes are read).
+def mem_files(image=None) :
+  files= []
+  for entry in iter_dir() :
+    if entry.rawtype & 0b111 != 0b010 or entry.block1==None : continue # PRG only
+    nbytes= 0
+    for nexts,block in blocks[entry.block1].chain() :
+      nbytes+= BYTESPERBLOCK-2 if block.data[0x00]!=0x00 else max(0,block.data[0x01]-1)
+    if nbytes<=2 : continue # no load address, or nothing to load
+    data= blocks[entry.block1].data
+    load= data[0x02]+256*data[0x03]
+    files.append( {'image':image, 'name':entry.fname, 'load':load, 'end':min(0x10000,load+nbytes-2), 'size':nbytes-2} )
+  return files
+
+
+# Interval index over the 64 kB address space: the elementary segments between all load and end addresses, 
+# sorted, each with the (indices of the) files that cover it. Built with one sweep over the sorted boundaries,
+# which also pairs each starting file with the files active at that point, giving the overlapping files per file.
+class MemIndex :
+
+  def __init__(self,files) :
+    self.files= files
+    events= sorted( [(f['load'],1,fix) for fix,f in enumerate(files)] + [(f['end'],-1,fix) for fix,f in enumerate(files)] )
+    self.segments= [] # (first, end (exclusive), tuple of fixs)
+    self.overlaps= [set() for f in files]
+    active= {}
+    for eix,(addr,delta,fix) in enumerate(events) :
+      if delta>0 :
+        for other in active :
+          self.overlaps[other].add(fix)
+          self.overlaps[fix].add(other)
+        active[fix]= None
+      else : 
+        active.pop(fix,None)
+      if eix+1<len(events) and events[eix+1][0]>addr :
+        self.segments.append( (addr,events[eix+1][0],tuple(active)) )
+
+  # Returns the indices of the files that share at least one address with file `fix`
+  def partners(self,fix) :
+    return sorted(self.overlaps[fix])
+
+
+def mem_label(f) :
+  return f"'{f['name']}'" if f['image']==None else f"{f['image']}:'{f['name']}'"
+
+
+# Generates a record per file (with its areas and overlapping files), then per segment of the memory map
+def gen_memrecords(files) :
+  index= MemIndex(files)
+  for fix,f in enumerate(files) :
+    yield {'record':"memfile", **f, 'areas':mem_areas(f['load'],f['end']), 'overlaps':[mem_label(files[other]) for other in index.partners(fix)]}
+  for (first,end,fixs) in index.segments :
+    yield {'record':"memsegment", 'first':first, 'last':end-1, 'size':end-first, 'areas':mem_areas(first,end,isfile=False), 'files':[mem_label(files[fix]) for fix in fixs]}
+
+
+# Generates the lines of the memory map view: a table of the files, then a table of the address ranges (holes and overlaps)
+def gen_memhuman(files,with_header=True,maxnames=4) :
+  index= MemIndex(files)
+  filesep= "|----------------------------------------|------|------|-------|------------------------------|----------|"
+  if with_header :
+    yield    "| file                                   | load | end  | bytes | areas (! is a conflict)      | overlaps |"
+    yield filesep
+  nconflicts= 0
+  for fix,f in enumerate(files) :
+    areas= mem_areas(f['load'],f['end'])
+    nconflicts+= any(area.endswith("!") for area in areas)
+    yield f"| {mem_label(f):<38.38} | {f['load']:04X} | {f['end']-1:04X} | {f['size']:>5} | {', '.join(areas):<28.28} | {len(index.partners(fix)):^8} |"
+  if with_header : 
+    yield filesep
+    yield ""
+  segsep= "|------|------|-------|------------------------------|--------------------------------------------------------------|"
+  if with_header :
+    yield "| from | to   | bytes | areas (! is a conflict)      | files                                                        |"
+    yield segsep
+  (noverlaps,noverlapbytes,nholes)= (0,0,0)
+  for (first,end,fixs) in index.segments :
+    names= [mem_label(files[fix]) for fix in fixs[:maxnames]]
+    what= ", ".join(names) + (f", ... ({len(fixs)-maxnames} more)" if len(fixs)>maxnames else "")
+    if len(fixs)==0 : 
+      what= "(hole)"
+      nholes+= 1
+    elif len(fixs)>1 : 
+      what= f"OVERLAP {len(fixs)}: "+what
+      noverlaps+= 1
+      noverlapbytes+= end-first
+    yield f"| {first:04X} | {end-1:04X} | {end-first:>5} | {', '.join(mem_areas(first,end,isfile=False)):<28.28} | {what:<60.60} |"
+  if with_header : yield segsep
+  yield f"{len(files)} files, {noverlaps} overlapping ranges ({noverlapbytes} bytes), {nholes} holes, {nconflicts} files load into a conflict area"
+
+
+#endregion
+#region ### WATCH ###################################################################
+
+# Returns the crc32 of every block in `content` (bytes, or an mmap), as an array
+def block_checksums(content) :
+  with memoryview(content) as view :
+    return array('L', ( zlib.crc32(view[bix*BYTESPERBLOCK:(bix+1)*BYTESPERBLOCK]) for bix in range(len(content)//BYTESPERBLOCK) ))
+
+
+# Watches an image file that another program (e.g. an emulator) writes into, and keeps `blocks` up to date.
+# A poll is one stat() when mtime, size and inode are unchanged. Otherwise the block checksums of the mapped 
+# file are compared (a G64 is decoded again, a manifest read from its store), and only the blocks that changed are updated.
+class ImageWatcher :
+
+  def __init__(self,filename) :
+    self.filename= filename
+    self.file= None
+    self.mm= None
+    self.stat= os.stat(filename)
+    self.sums= block_checksums( b"".join(block.data for block in blocks) ) # what is loaded now
+
+  # (Re)maps the file, e.g. after it was replaced by a new one (new inode) or changed size
+  def _map(self) :
+    self.close()
+    self.file= open(self.filename, mode='rb')
+    self.mm= mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+
+  def close(self) :
+    if self.mm!=None : self.mm.close()
+    if self.file!=None : self.file.close()
+    self.mm= None
+    self.file= None
+
+  # Returns the bixs of the blocks that changed since the previous poll, and updates those in `blocks`
+  def poll(self) :
+    try :
+      stat= os.stat(self.filename)
+    except OSError : 
+      return [] # being replaced, try next poll
+    if (stat.st_mtime_ns,stat.st_size,stat.st_ino)==(self.stat.st_mtime_ns,self.stat.st_size,self.stat.st_ino) : return []
+    if stat.st_size==0 : return [] # being rewritten, try next poll
+    if self.mm==None or stat.st_ino!=self.stat.st_ino or stat.st_size!=len(self.mm) : self._map()
+    content= self.mm
+    errors= {}
+    try :
+      if content[0:len(G64SIGNATURE)]==G64SIGNATURE : (content,errors)= g64_decode(content[:])
+      elif content[0:len(D64MSIGNATURE)]==D64MSIGNATURE : content= d64m_decode(content[:],self.filename)
+    except (OSError,ValueError) :
+      return [] # half written G64 or manifest, try when it changes again
+    if len(content)!=BLOCKSPERDISK*BYTESPERBLOCK : return []
+    self.stat= stat
+    sums= block_checksums(content)
+    changed= [bix for bix in range(BLOCKSPERDISK) if sums[bix]!=self.sums[bix] or blocks[bix].err!=errors.get(bix)]
+    for bix in changed :
+      blocks[bix].data= content[bix*BYTESPERBLOCK:(bix+1)*BYTESPERBLOCK]
+      blocks[bix].err= errors.get(bix)
+    self.sums= sums
+    return changed
+
+
+#endregion
+#region ### SIMILARITY ##############################################################
+
+MINHASHBINS = 64 # values in a MinHash signature
+LSHBANDS    = 16 # signature is split in bands of MINHASHBINS/LSHBANDS values
+SIMILARITY  = 0.8 # default minimal similarity for images to be clustered (--msimilar)
+IMAGEEXTS   = (".d64",".g64",".d64m")
+MASK64      = (1<<64)-1
+
+
+# Generates the image files in `paths`; directories are searched recursively (sorted) for IMAGEEXTS files
+def image_files(paths) :
+  for path in paths :
+    if not os.path.isdir(path) :
+      yield path
+      continue
+    for (dirpath,dirnames,filenames) in os.walk(path) :
+      dirnames.sort()
+      for name in sorted(filenames) :
+        if os.path.splitext(name)[1].lower() in IMAGEEXTS : yield os.path.join(dirpath,name)
+
+
+# Returns (content,errors) of image `filename` (a d64, a G64 which is decoded, or a manifest read from its store); raises OSError or ValueError
+def read_image(filename) :
+  with open(filename, mode='rb') as file :
+    content= file.read()
+  errors= {}
+  if content[0:len(G64SIGNATURE)]==G64SIGNATURE :
+    (content,errors)= g64_decode(content)
+  elif content[0:len(D64MSIGNATURE)]==D64MSIGNATURE :
+    content= d64m_decode(content,filename)
+  if len(content)!=BLOCKSPERDISK*BYTESPERBLOCK :
+    raise ValueError(f"has size {len(content)}, expected {BLOCKSPERDISK*BYTESPERBLOCK}")
+  return (content,errors)
+
+
+# Returns the fingerprints (ints) of the non-empty blocks in `content`; a fingerprint includes the block index
+def block_features(content) :
+  view= memoryview(content)
+  features= []
+  for bix in range(BLOCKSPERDISK) :
+    data= view[bix*BYTESPERBLOCK:(bix+1)*BYTESPERBLOCK]
+    if not block_isempty(data) : features.append( zlib.crc32(data)<<10 | bix )
+  return features
+
+
+# Returns the MinHash signature (array of MINHASHBINS ints) of the set `features`, None for an empty set.
+# One permutation hashing: each feature is hashed once, the top bits select a bin, each bin keeps its minimum.
+# Empty bins are densified by rotation: they borrow the value of the next non-empty bin, offset by the distance.
+def minhash(features) :
+  if len(features)==0 : return None
+  binbits= MINHASHBINS.bit_length()-1
+  valbits= 64-binbits
+  empty= 1<<valbits
+  sig= [empty]*MINHASHBINS
+  for f in features :
+    h= (f*0x9E3779B97F4A7C15) & MASK64 # multiplicative hash: top bits depend on all bits of f
+    h^= h>>31
+    h= (h*0xBF58476D1CE4E5B9) & MASK64
+    b= h>>valbits
+    v= h & (empty-1)
+    if v<sig[b] : sig[b]= v
+  for b in range(MINHASHBINS) :
+    if sig[b]==empty :
+      dist= 1
+      while sig[(b+dist)%MINHASHBINS]>=empty : dist+= 1 # skip empty and already densified bins
+      sig[b]= sig[(b+dist)%MINHASHBINS] + (dist<<valbits)
+  return array('Q',sig)
+
+
+# Returns the estimated similarity (0..1) of two MinHash signatures
+def minhash_similarity(sig1,sig2) :
+  return sum(map(operator.eq,sig1,sig2))/MINHASHBINS
+
+
+# Clusters the images in `filenames` whose estimated similarity is at least `threshold`.
+# The signatures are banded in an LSH index; an image is only compared with the images in its buckets.
+# A bucket keeps one image per cluster, so duplicates do not make buckets grow (scales to large collections).
+# Returns (clusters,skipped): clusters is a list of lists of filenames (2 or more), skipped a list of (filename,reason)
+def similar_clusters(filenames,threshold) :
+  rows= MINHASHBINS//LSHBANDS
+  names= []
+  sigs= []
+  parent= []
+  buckets= [dict() for band in range(LSHBANDS)]
+  skipped= []
+  def find(i) :
+    while parent[i]!=i :
+      parent[i]= parent[parent[i]]
+      i= parent[i]
+    return i
+  for filename in filenames :
+    try :
+      (content,errors)= read_image(filename)
+    except (OSError,ValueError) as e :
+      skipped.append( (filename,str(e)) )
+      continue
+    sig= minhash(block_features(content))
+    if sig==None :
+      skipped.append( (filename,"all blocks empty") )
+      continue
+    i= len(names)
+    names.append(filename)
+    sigs.append(sig)
+    parent.append(i)
+    for band in range(LSHBANDS) :
+      key= hash(sig[band*rows:(band+1)*rows].tobytes())
+      bucket= buckets[band].get(key)
+      if bucket==None :
+        buckets[band][key]= [i]
+        continue
+      joined= False
+      for j in bucket :
+        if find(j)==find(i) : 
+          joined= True
+        elif minhash_similarity(sig,sigs[j])>=threshold :
+          parent[find(i)]= find(j)
+          joined= True
+      if not joined : bucket.append(i)
+  clusters= {}
+  for i in range(len(names)) :
+    clusters.setdefault(find(i),[]).append(names[i])
+  return ([c for c in clusters.values() if len(c)>1],skipped)
+
+
+# Generates a record per image in a near-duplicate cluster of the images in `paths` (files or directories), followed 
+# by a record per skipped image. The first image of a cluster is its reference, the others are compared to it (re-read).
+def gen_similarrecords(paths,threshold) :
+  (clusters,skipped)= similar_clusters(image_files(paths),threshold)
+  for cix,cluster in enumerate(sorted(clusters,key=len,reverse=True),1) :
+    (ref,errors)= read_image(cluster[0])
+    reffeatures= set(block_features(ref))
+    yield {'record':"similar", 'cluster':cix, 'image':cluster[0], 'reference':True, 'similarity':1.0, 'differ':[]}
+    for filename in cluster[1:] :
+      (content,errors)= read_image(filename)
+      features= set(block_features(content))
+      similar= len(reffeatures & features)/len(reffeatures | features)
+      diffs= [bix for bix in range(BLOCKSPERDISK) if ref[bix*BYTESPERBLOCK:(bix+1)*BYTESPERBLOCK]!=content[bix*BYTESPERBLOCK:(bix+1)*BYTESPERBLOCK]]
+      yield {'record':"similar", 'cluster':cix, 'image':filename, 'reference':False, 'similarity':round(similar,4), 'differ':diffs}
+  for (filename,reason) in skipped :
+    yield {'record':"skipped", 'image':filename, 'reason':reason}
+
+
+# Generates the near-duplicate report for the images in `paths` (files or directories)
+def gen_similarhuman(paths,threshold,with_header=True) :
+  linesep= "|---------|------------------------------------------|---------|--------|"
+  if with_header :
+    yield "| cluster | image                                    | similar | differ | differing blocks (track/sector=block)"
+    yield linesep
+  numclusters= 0
+  numskipped= 0
+  for record in gen_similarrecords(paths,threshold) :
+    if record['record']=="skipped" :
+      if numskipped==0 and numclusters>0 and with_header : yield linesep
+      numskipped+= 1
+      yield f"skipped '{record['image']}': {record['reason']}"
+    elif record['reference'] :
+      if numclusters>0 and with_header : yield linesep
+      numclusters+= 1
+      yield f"| {record['cluster']:^7} | {record['image']:<40s} |   ref   |        |"
+    else :
+      diffs= record['differ']
+      blocklist= ' '.join( f"{'/'.join(map(str,bix2ts(bix)))}={bix}" for bix in diffs[:12] ) + (' ...' if len(diffs)>12 else '')
+      yield f"| {record['cluster']:^7} | {record['image']:<40s} | {record['similarity']:7.2f} | {len(diffs):^6} | {blocklist}"
+  if numskipped==0 and numclusters>0 and with_header : yield linesep
+  yield f"{numclusters} clusters of near-duplicate images (similarity {threshold} or more), {numskipped} images skipped"
+
 
+#endregion
+#region ### STORE ###################################################################
+
+# A store is a directory with the distinct blocks of many images: blocks.dat has the blocks (256 bytes each) and 
+# blocks.idx the sha1 of each block (20 bytes each), in the same order. Both are only appended to, so existing 
+# manifests stay valid when more images are packed.
+# An image in the store is a manifest file (.d64m): signature "D64M", version (01), the number of directory 
+# levels from the manifest up to the store (manifests may be in subdirectories), then per block of the image 
+# the 4 byte index of that block in blocks.dat. A manifest has 2738 bytes, an image 174848.
+D64MSIGNATURE = b"D64M"
+D64MHEADER    = struct.Struct("<4sBB") # signature, version, levels
+STOREDATA     = "blocks.dat"
+STOREINDEX    = "blocks.idx"
+STOREHASHSIZE = 20 # sha1
+
+
+# Returns the content of the image with manifest `content` (read from file `filename`); raises OSError or ValueError.
+# Only the blocks of the image are read from the store (blocks.dat is mapped, not read).
+def d64m_decode(content,filename) :
+  if len(content)<D64MHEADER.size or (len(content)-D64MHEADER.size)%4!=0 :
+    raise ValueError(f"manifest has size {len(content)}, expected {D64MHEADER.size}+4*blocks")
+  (signature,version,levels)= D64MHEADER.unpack_from(content)
+  if signature!=D64MSIGNATURE or version!=1 :
+    raise ValueError(f"not a version 1 manifest")
+  refs= struct.unpack_from( f"<{(len(content)-D64MHEADER.size)//4}I", content, D64MHEADER.size )
+  storedir= os.path.join( os.path.dirname(filename), *[".."]*levels )
+  with open(os.path.join(storedir,STOREDATA), mode='rb') as file, mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ) as mm :
+    if max(refs,default=0)>=len(mm)//BYTESPERBLOCK :
+      raise ValueError(f"manifest refers to block {max(refs)}, store {storedir} has {len(mm)//BYTESPERBLOCK}")
+    return b"".join( mm[ref*BYTESPERBLOCK:(ref+1)*BYTESPERBLOCK] for ref in refs )
+
+
+# Adds images to the store in directory `storedir` (created when needed), each block only once
+class BlockStore :
+
+  def __init__(self,storedir) :
+    os.makedirs(storedir,exist_ok=True)
+    self.storedir= storedir
+    self.datfile= open(os.path.join(storedir,STOREDATA), mode='ab')
+    self.idxfile= open(os.path.join(storedir,STOREINDEX), mode='ab+')
+    self.idxfile.seek(0)
+    digests= self.idxfile.read()
+    self.nblocks= len(digests)//STOREHASHSIZE
+    if self.datfile.tell()!=self.nblocks*BYTESPERBLOCK or len(digests)%STOREHASHSIZE!=0 :
+      self.close()
+      raise ValueError(f"{STOREDATA} and {STOREINDEX} in {storedir} do not match")
+    self.index= { digests[ref*STOREHASHSIZE:(ref+1)*STOREHASHSIZE]:ref for ref in range(self.nblocks) }
+
+  def close(self) :
+    self.datfile.close()
+    self.idxfile.close()
+
+  # Adds the blocks of `content` that are not yet in the store; returns their refs and the number of blocks added
+  def add(self,content) :
+    view= memoryview(content)
+    refs= []
+    nnew= 0
+    for bix in range(len(content)//BYTESPERBLOCK) :
+      data= view[bix*BYTESPERBLOCK:(bix+1)*BYTESPERBLOCK]
+      digest= hashlib.sha1(data).digest()
+      ref= self.index.get(digest)
+      if ref==None :
+        ref= self.nblocks
+        self.datfile.write(data)
+        self.idxfile.write(digest)
+        self.index[digest]= ref
+        self.nblocks+= 1
+        nnew+= 1
+      refs.append(ref)
+    return (refs,nnew)
+
+  # Writes the manifest `relname` (path relative to the store) with `refs`
+  def write_manifest(self,relname,refs) :
+    filename= os.path.join(self.storedir,relname)
+    os.makedirs(os.path.dirname(filename),exist_ok=True)
+    with open(filename, mode='wb') as file :
+      file.write( D64MHEADER.pack(D64MSIGNATURE,1,relname.count(os.sep)) + struct.pack(f"<{len(refs)}I",*refs) )
+
+
+# Generates (filename,relname) for the images in `paths` like image_files(), relname is relative to the directory passed
+def image_relnames(paths) :
+  for path in paths :
+    for filename in image_files([path]) :
+      yield (filename, os.path.relpath(filename,path) if os.path.isdir(path) else os.path.basename(filename))
+
+
+# Packs all images in `paths` into the store in `storedir`, generating a line of feedback per image
+def gen_pack(paths,storedir) :
+  store= BlockStore(storedir)
+  (nimages,nbefore,done)= (0,store.nblocks,set())
+  try :
+    for (filename,relname) in image_relnames(paths) :
+      relname= os.path.splitext(relname)[0]+".d64m"
+      if relname in done :
+        yield f"skipped '{filename}': manifest {relname} already written for another image"
+        continue
+      try :
+        (content,errors)= read_image(filename)
+      except (OSError,ValueError) as e :
+        yield f"skipped '{filename}': {e}"
+        continue
+      (refs,nnew)= store.add(content)
+      store.write_manifest(relname,refs)
+      done.add(relname)
+      nimages+= 1
+      yield f"packed '{filename}' as {relname}: {len(refs)} blocks, {nnew} new{f' ({len(errors)} G64 decode errors not kept)' if errors else ''}"
+  finally :
+    store.close()
+  yield f"{nimages} images packed, store has {store.nblocks} blocks ({store.nblocks-nbefore} new), {store.nblocks*BYTESPERBLOCK//1024} kB for {nimages*BLOCKSPERDISK*BYTESPERBLOCK//1024} kB of images packed now"
+
+
+# Unpacks all manifests in `paths` to d64 images in `outdir`, generating a line of feedback per image
+def gen_unpack(paths,outdir) :
+  nimages= 0
+  for (filename,relname) in image_relnames(paths) :
+    if not filename.lower().endswith(".d64m") : continue
+    outname= os.path.join(outdir,os.path.splitext(relname)[0]+".d64")
+    if os.path.exists(outname) :
+      yield f"skipped '{filename}': {outname} already exists"
+      continue
+    try :
+      (content,errors)= read_image(filename)
+      os.makedirs(os.path.dirname(outname),exist_ok=True)
+      with open(outname, mode='xb') as file :
+        file.write(content)
+    except (OSError,ValueError) as e :
+      yield f"skipped '{filename}': {e}"
+      continue
+    nimages+= 1
+    yield f"unpacked '{filename}' to {outname}"
+  yield f"{nimages} images unpacked"
+
+
+#endregion
+#region ### INTEGRITY ###############################################################
+
+# A manifest (--amanifest) has one json object per line. The first line identifies the manifest, every next line 
+# is an image: its path (relative to the manifest), the sha256 of its 683 blocks (as the viewer sees them, so a G64 
+# is decoded and a .d64m read from its store), and a hash per block; the position in the list is the block index.
+# Verify (--averify) hashes every image again in a pool of threads. hashlib releases the GIL for large buffers, 
+# so the image hash of a d64 (over the mapped file) runs in parallel. Only when that differs the blocks are hashed.
+INTEGRITYHEADER = {'manifest':"d64viewer integrity", 'version':1, 'imagehash':"sha256", 'blockhash':"blake2b-64"}
+
+
+def block_hash(data) :
+  return hashlib.blake2b(data,digest_size=8).hexdigest()
+
+
+# Returns (nbytes,imagehash,blockhashes) for image `filename`, `blockhashes` only when `with_blocks` or when the 
+# image hash differs from `expected`; raises OSError or ValueError. Runs in a worker thread: touches no globals.
+def image_hashes(filename,with_blocks=True,expected=None) :
+  with open(filename, mode='rb') as file, mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ) as mm :
+    if mm[:len(G64SIGNATURE)]==G64SIGNATURE or mm[:len(D64MSIGNATURE)]==D64MSIGNATURE :
+      content= read_image(filename)[0]
+    elif len(mm)!=BLOCKSPERDISK*BYTESPERBLOCK :
+      raise ValueError(f"has size {len(mm)}, expected {BLOCKSPERDISK*BYTESPERBLOCK}")
+    else :
+      content= mm
+    size= len(mm)
+    with memoryview(content) as view :
+      imagehash= hashlib.sha256(view).hexdigest()
+      blockhashes= None
+      if with_blocks or imagehash!=expected :
+        blockhashes= [ block_hash(view[bix*BYTESPERBLOCK:(bix+1)*BYTESPERBLOCK]) for bix in range(BLOCKSPERDISK) ]
+  return (size,imagehash,blockhashes)
+
+
+# Returns a description per bix in `bixs` of what the block of `content` belongs to (BAM, directory, or file names)
+def damaged_owners(content,bixs) :
+  set_blocks(content) # iter_dir and chains work on the current disk
+  owners= { TRACKSTART[18]:["BAM"] }
+  for nexts,block in blocks[TRACKSTART[18]+1].chain() : owners.setdefault(block.bix,[]).append("directory")
+  for entry in iter_dir() :
+    if entry.block1==None : continue
+    chains= [ [block.bix for nexts,block in blocks[entry.block1].chain()] ]
+    if entry.isvlir() : chains+= [chain for chain in geos_records(blocks[entry.block1]) if chain!=None]
+    for chain in chains :
+      for bix in chain : owners.setdefault(bix,[]).append(f"'{entry.fname}'")
+  return { bix:", ".join(dict.fromkeys(owners.get(bix,["unused"]))) for bix in bixs }
+
+
+# Writes manifest `manifestname` for all images in `paths`, hashing them in a thread pool; generates feedback lines
+def gen_manifest(paths,manifestname) :
+  filenames= list(image_files(paths))
+  base= os.path.dirname(os.path.abspath(manifestname))
+  (nimages,nbytes,start)= (0,0,time.perf_counter())
+  with open(manifestname, mode='x', encoding='utf-8') as file, concurrent.futures.ThreadPoolExecutor() as pool :
+    file.write( json.dumps(INTEGRITYHEADER)+"\n" )
+    futures= [ pool.submit(image_hashes,filename) for filename in filenames ]
+    for filename,future in zip(filenames,futures) :
+      try :
+        (size,imagehash,blockhashes)= future.result()
+      except (OSError,ValueError) as e :
+        yield f"skipped '{filename}': {e}"
+        continue
+      relname= os.path.relpath(os.path.abspath(filename),base)
+      file.write( json.dumps({'image':relname, 'size':size, 'sha256':imagehash, 'blocks':blockhashes})+"\n" )
+      (nimages,nbytes)= (nimages+1,nbytes+size)
+  seconds= time.perf_counter()-start
+  yield f"{nimages} images in manifest '{manifestname}'; hashed {nbytes/1e6:.1f} MB in {seconds:.2f} s ({nbytes/1e6/max(seconds,1e-9):.1f} MB/s)"
+
+
+# Verifies the images in `paths` against manifest `manifestname`; generates a record per image (status ok, new, 
+# unreadable, damaged with its blocks and their owners, or missing) and a summary record.
+# `result` (a dict) gets the counts, so the caller can set the exit status.
+def gen_verifyrecords(paths,manifestname,result) :
+  base= os.path.dirname(os.path.abspath(manifestname))
+  with open(manifestname, encoding='utf-8') as file :
+    header= json.loads(file.readline() or "{}")
+    if header.get('manifest')!=INTEGRITYHEADER['manifest'] or header.get('version')!=INTEGRITYHEADER['version'] :
+      raise ValueError(f"'{manifestname}' is not a version {INTEGRITYHEADER['version']} integrity manifest")
+    expected= {}
+    for line in file :
+      record= json.loads(line)
+      expected[os.path.normpath(os.path.join(base,record['image']))]= record
+  filenames= list(image_files(paths))
+  found= { os.path.normpath(os.path.abspath(filename)) for filename in filenames }
+  counts= dict.fromkeys(("ok","damaged","unreadable","new","missing"),0)
+  (nbytes,start)= (0,time.perf_counter())
+  with concurrent.futures.ThreadPoolExecutor() as pool :
+    futures= {}
+    for filename in filenames :
+      record= expected.get(os.path.normpath(os.path.abspath(filename)))
+      if record==None :
+        counts["new"]+= 1
+        yield {'record':"verify", 'image':filename, 'status':"new"}
+        continue
+      futures[filename]= (record,pool.submit(image_hashes,filename,False,record['sha256']))
+    for filename,(record,future) in futures.items() :
+      try :
+        (size,imagehash,blockhashes)= future.result()
+      except (OSError,ValueError) as e :
+        counts["unreadable"]+= 1
+        yield {'record':"verify", 'image':filename, 'status':"unreadable", 'error':str(e)}
+        continue
+      nbytes+= size
+      if imagehash==record['sha256'] :
+        counts["ok"]+= 1
+        yield {'record':"verify", 'image':filename, 'status':"ok", 'size':size}
+        continue
+      counts["damaged"]+= 1
+      bixs= [ bix for bix in range(BLOCKSPERDISK) if blockhashes[bix]!=record['blocks'][bix] ]
+      try :
+        owners= damaged_owners(read_image(filename)[0],bixs)
+      except (OSError,ValueError) :
+        owners= dict.fromkeys(bixs,"unknown (image no longer readable)")
+      damaged= [ {'block':bix, 'track':bix2ts(bix)[0], 'sector':bix2ts(bix)[1], 'owner':owners[bix]} for bix in bixs ]
+      yield {'record':"verify", 'image':filename, 'status':"damaged", 'size':size, 'manifestsize':record['size'], 'blocks':damaged}
+  for name in sorted(set(expected)-found) :
+    counts["missing"]+= 1
+    yield {'record':"verify", 'image':expected[name]['image'], 'status':"missing"}
+  result.update(counts)
+  yield {'record':"verifysummary", **counts, 'bytes':nbytes, 'seconds':round(time.perf_counter()-start,3)}
+
+
+# Generates the lines of the verify report from the records of gen_verifyrecords: 
+# a line per image that is not ok (damaged ones with a line per block), then the summary
+def gen_verifyhuman(records) :
+  for record in records :
+    if record['record']=="verifysummary" :
+      counts= {what:record[what] for what in ("ok","damaged","unreadable","new","missing")}
+      (mb,seconds)= (record['bytes']/1e6,record['seconds'])
+      yield f"{sum(counts.values())} images: {', '.join(f'{n} {what}' for what,n in counts.items())}; hashed {mb:.1f} MB in {seconds:.2f} s ({mb/max(seconds,1e-9):.1f} MB/s)"
+    elif record['status']=="new" :
+      yield f"NEW        '{record['image']}': not in manifest"
+    elif record['status']=="unreadable" :
+      yield f"UNREADABLE '{record['image']}': {record['error']}"
+    elif record['status']=="damaged" :
+      sizemsg= "" if record['size']==record['manifestsize'] else f", size {record['size']} was {record['manifestsize']}"
+      yield f"DAMAGED    '{record['image']}': {len(record['blocks'])} blocks{sizemsg}"
+      for block in record['blocks'] :
+        yield f"           block {block['block']} track {block['track']} sector {block['sector']}: {block['owner']}"
+    elif record['status']=="missing" :
+      yield f"MISSING    '{record['image']}': in manifest (path relative to it), not found"
 
 
 #endregion
@@ -882,7 +3182,7 @@ def main() :
   parser = argparse.ArgumentParser(prog='d64viewer',
                     description='Prints disk blocks inside a d64 file in hex/bam/dir/basic format',
                     epilog='2025 Maarten Pennings')
-  parser.add_argument("filename")
+  parser.add_argument("filename", nargs='+', help='d64 or G64 image, or d64m manifest in a store (--tsimilar, --apack, --aunpack, --amanifest, --averify: several images or directories)')
   topicgroup = parser.add_argument_group('topic','Select which disk blocks to print, default is --tdir')
   topicgroupx = topicgroup.add_mutually_exclusive_group()
   topicgroupx.add_argument('--tblock', help='topic is a disk block, pass either <num> (0..682) or <track>/<sector> (1..35/0..16|17|18|20)',metavar='blockix')
@@ -890,39 +3190,297 @@ def main() :
   topicgroupx.add_argument('--tdir', help='topic is the directory, pass nothing or 1..18', nargs='?', type=int, const=0)
   topicgroupx.add_argument('--tfile', help='topic is a file, pass filename (optionally enclosed in \'\' or "")', metavar='filename')
   topicgroupx.add_argument('--tdisk', help='topic is disk overview', action='store_true')
+  topicgroupx.add_argument('--tfrag', help='topic is the fragmentation of all files', action='store_true')
+  topicgroupx.add_argument('--tlost', help='topic is recovery of deleted files and orphan chains, optionally pass rank to select one', nargs='?', type=int, const=0, metavar='rank')
+  topicgroupx.add_argument('--tsimilar', help='topic is near-duplicate images among all images passed (minimal similarity see --msimilar)', action='store_true')
+  topicgroupx.add_argument('--tgeos', help='topic is the GEOS files, or one GEOS file with its info block and VLIR records (pass filename)', nargs='?', const='', metavar='filename')
+  topicgroupx.add_argument('--tmem', help='topic is the C64 memory map of all PRG files (load address to end): overlaps, holes, conflicts; also over several images or directories', action='store_true')
+  topicgroupx.add_argument('--tload', help='topic is the estimated load time of all files, or of one file (pass filename)', nargs='?', const='', metavar='filename')
   viewgroup = parser.add_argument_group('view', 'Which view is used for the selected block, default is "implied by topic"')
   viewgroupx = viewgroup.add_mutually_exclusive_group()
   viewgroupx.add_argument('--vhex', help='view as raw hex table (always "tech")', action='store_true')
   viewgroupx.add_argument('--vbam', help='view as BAM table', action='store_true')
   viewgroupx.add_argument('--vdir', help='view as directry entries', action='store_true')
   viewgroupx.add_argument('--vbasic', help='view as basic program (must start with first block of program)', action='store_true')
+  viewgroupx.add_argument('--vasm', help='view as 6502 disassembly (must start with first block of program)', action='store_true')
+  viewgroupx.add_argument('--vxref', help='view as cross-reference of basic program: jump targets and variables (must start with first block of program)', action='store_true')
+  actiongroup = parser.add_argument_group('action','Changes the d64 file (or writes a new one) before the view is printed')
+  actiongroup.add_argument('--arelayout', help='writes a new d64 with all files contiguous and at best interleave, pass filename', metavar='filename')
+  actiongroup.add_argument('--apack', help='packs all images passed into a block store (every distinct block stored once, a .d64m manifest per image), pass store directory', metavar='storedir')
+  actiongroup.add_argument('--aunpack', help='unpacks all .d64m manifests passed to d64 images, pass output directory', metavar='dir')
+  actiongroup.add_argument('--amanifest', help='writes an integrity manifest (image and block hashes) of all images passed, pass manifest filename', metavar='filename')
+  actiongroup.add_argument('--averify', help='verifies all images passed against an integrity manifest, reports damaged blocks and files, pass manifest filename', metavar='filename')
+  actiongroup.add_argument('--aput', help='adds files to the d64 (name from filename, type from extension .prg/.seq/.usr; a .bas listing is tokenized to a prg)', nargs='+', metavar='file')
   modgroup = parser.add_argument_group('modifiers','Allows to add/suppress features of the view')
   modgroup.add_argument('--mtech', help='modify view to be more tech (0, 1, 2)', default=0, nargs='?', type=int, const=1)
   modgroup.add_argument('--mblockid', help='modify view with *no* blockid\'s', action='store_true')
   modgroup.add_argument('--mheader', help='modidy view with *no* column headers', action='store_true')
   modgroup.add_argument('--mnotes', help='modify view with documentation notes', action='store_true')
   modgroup.add_argument('--mcont', help='modify view by continuing with next blocks (tdir and vbasic have own defaults)', metavar='num') # with_next
-  modgroup.add_argument('--msave', help='saves the selected disk blocks to file (raw, not the view), pass filename', metavar='filename') # with_next
+  modgroup.add_argument('--mlimit', help='modify view by printing at most num lines (hex, dir and asm view)', metavar='num', type=int)
+  modgroup.add_argument('--mpage', help='modify view by printing page num (1..) of --mlimit lines', metavar='num', type=int)
+  modgroup.add_argument('--mlines', help='modify basic view to only show lines from-to (either may be omitted, or pass one line number)', metavar='from-to')
+  modgroup.add_argument('--mcharset', help='modify view to render PETSCII with the upper/graphics (default), lower/upper or ascii-only charset', choices=['upper','lower','ascii'], default='upper')
+  modgroup.add_argument('--format', help='output the view as text (default), or as records in one json array or in ndjson (one json object per line)', choices=['text','json','ndjson'], default='text')
+  modgroup.add_argument('--mwatch', help='modify view to watch the image, re-rendering when it changes, optionally pass poll interval (default 0.5s)', nargs='?', type=float, const=0.5, metavar='sec')
+  modgroup.add_argument('--mrecord', help='modify tgeos filename to view VLIR record num (0..126) like a file', metavar='num', type=int)
+  modgroup.add_argument('--mheat', help='modify disk view to a heatmap of block entropy and class (text, code, compressed, fill)', action='store_true')
+  modgroup.add_argument('--msimilar', help=f'modify similar topic with the minimal similarity of clustered images (default {SIMILARITY})', metavar='0..1', type=float)
+  modgroup.add_argument('--mproc', help='modify load time estimate with processing time per block (ms)', metavar='ms', type=float)
+  modgroup.add_argument('--msave', help='saves the selected disk blocks to file (raw, not the view), pass filename (a new directory for --tlost and --tgeos filename)', metavar='filename') # with_next
   #sys.argv= "d64viewer.py cases.d64 --tfile CASE-09".split(" ")
   #sys.argv= "d64viewer.py cases.d64 --tblock 345 --vbasic --mcont 8".split(" ")
   #sys.argv= "d64viewer.py cases.d64 --tfile CASE-08 --vbasic --msave c08-1.txt --mtech 1".split(" ")
   #sys.argv= "d64viewer.py ..\\testcases\\cases.d64 --tfile CASE-09 --vbasic".split(" ")
   args = parser.parse_args()
   #print(args) # todo remove
+  set_charset(args.mcharset)
+  set_replace(sys.stdout)
+  set_replace(sys.stderr)
+  out= sys.stdout # the view: text, or records with --format json/ndjson
+  msg= sys.stdout if args.format=="text" else sys.stderr # feedback and warnings, kept out of the records
+
+  # Determine modifiers
+  mmsg=""
+  mcont=0
+  if args.mtech<0 or args.mtech>2 : 
+    sys.exit( f"{parser.prog}: error: mtech must be 0..2, not {args.mtech}" )
+  mmsg+= f" tech{args.mtech}"
+  if args.mblockid:
+    mmsg+= " blockid"
+  if args.mheader:
+    mmsg+= " header"
+  if args.mnotes and args.format!="text" :
+    print( f"{parser.prog}: warning: notes are text, not records (ignoring --mnotes)\n", file=msg )
+    args.mnotes= False
+  if args.mnotes:
+    mmsg+= " notes"
+  if args.mcont!=None:
+    if not args.mcont.isdigit() :
+      sys.exit( f"{parser.prog}: error: mcont must be num, not {args.tdir}" )
+    mcont= int(args.mcont)
+    if mcont<0 or mcont>BLOCKSPERDISK : 
+      sys.exit( f"{parser.prog}: error: unexpected value for mcont: {mcont}" )
+    mmsg+= f" cont({mcont})"
+  mpage=1
+  if args.mlimit!=None:
+    if args.mlimit<1 :
+      sys.exit( f"{parser.prog}: error: mlimit must be 1 or more, not {args.mlimit}" )
+    mmsg+= f" limit({args.mlimit})"
+  if args.mpage!=None:
+    if args.mlimit==None :
+      sys.exit( f"{parser.prog}: error: mpage needs mlimit" )
+    if args.mpage<1 :
+      sys.exit( f"{parser.prog}: error: mpage must be 1 or more, not {args.mpage}" )
+    mpage= args.mpage
+    mmsg+= f" page({mpage})"
+  proctime= BLOCKPROCESSTIME
+  if args.mproc!=None:
+    if args.mproc<0 :
+      sys.exit( f"{parser.prog}: error: mproc must be 0 or more, not {args.mproc}" )
+    proctime= args.mproc/1000
+    mmsg+= f" proc({args.mproc}ms)"
+  similarity= SIMILARITY
+  if args.msimilar!=None:
+    if not args.tsimilar :
+      sys.exit( f"{parser.prog}: error: msimilar needs tsimilar" )
+    if args.msimilar<0 or args.msimilar>1 :
+      sys.exit( f"{parser.prog}: error: msimilar must be 0..1, not {args.msimilar}" )
+    similarity= args.msimilar
+    mmsg+= f" similar({args.msimilar})"
+  linerange= None
+  if args.mlines!=None:
+    (lo,sep,hi)= args.mlines.partition("-")
+    if not (lo+hi).isdigit() :
+      sys.exit( f"{parser.prog}: error: mlines must be from-to, from-, -to or a line number, not {args.mlines}" )
+    linerange= (int(lo) if lo!="" else 0, int(hi) if hi!="" else (int(lo) if sep=="" else 63999))
+    mmsg+= f" lines({linerange[0]}-{linerange[1]})"
+  if args.mrecord!=None:
+    if args.tgeos==None or args.tgeos=="" :
+      sys.exit( f"{parser.prog}: error: mrecord needs tgeos with a filename" )
+    mmsg+= f" record({args.mrecord})"
+  if args.mheat:
+    mmsg+= " heat"
+  if args.mwatch!=None:
+    if args.mwatch<=0 :
+      sys.exit( f"{parser.prog}: error: mwatch must be more than 0, not {args.mwatch}" )
+    mmsg+= f" watch({args.mwatch}s)"
+  if args.msave!=None:
+    if os.path.exists(args.msave):
+      sys.exit( f"{parser.prog}: error: msave file {args.msave} already exists" )
+    mmsg+= f" save({args.msave})"
+  if mmsg=="" : 
+    mmsg="no modifiers"
+  else : 
+    mmsg= mmsg[1:] # strip leading space
+  # convenient defaults
+  if args.mcont==None :
+    if args.tblock==None and not args.tbam and args.tdir==None and args.tfile==None and not args.tdisk and args.tload==None and not args.tfrag and not args.tsimilar and args.tlost==None and args.tgeos==None and not args.tmem:
+      mcont=17 # entire dir
+      mmsg+= f" cont({mcont})"
+    if args.tdir==0 : 
+      mcont=17 # entire dir
+      mmsg+= f" cont({mcont})"
+    if args.tfile!=None or (args.tlost!=None and args.tlost!=0) or args.mrecord!=None : 
+      mcont=682 # ensure whole file
+      mmsg+= f" cont({mcont})"
+
+  # Collection actions work on all images passed, and print no view
+  collectionactions= [args.apack,args.aunpack,args.amanifest,args.averify]
+  if collectionactions!=[None]*len(collectionactions) :
+    if len(collectionactions)-collectionactions.count(None)>1 or args.arelayout!=None or args.aput!=None or args.tsimilar :
+      sys.exit( f"{parser.prog}: error: apack, aunpack, amanifest and averify can not be combined with other actions or topic similar" )
+    if args.format!="text" and args.averify==None :
+      sys.exit( f"{parser.prog}: error: apack, aunpack and amanifest only report progress, --format applies to averify" )
+    for filename in args.filename :
+      if not os.path.exists(filename):
+        sys.exit(f"{parser.prog}: error: {filename} not found")
+    try :
+      if args.apack!=None :
+        print( f"{parser.prog}: packing {len(args.filename)} path(s) into store {args.apack}", file=msg)
+        emit(gen_pack(args.filename,args.apack),None,1,out)
+      elif args.aunpack!=None :
+        print( f"{parser.prog}: unpacking {len(args.filename)} path(s) into {args.aunpack}", file=msg)
+        emit(gen_unpack(args.filename,args.aunpack),None,1,out)
+      elif args.amanifest!=None :
+        print( f"{parser.prog}: writing integrity manifest {args.amanifest} for {len(args.filename)} path(s)", file=msg)
+        emit(gen_manifest(args.filename,args.amanifest),None,1,out)
+      else :
+        print( f"{parser.prog}: verifying {len(args.filename)} path(s) against integrity manifest {args.averify}", file=msg)
+        result= {}
+        records= gen_verifyrecords(args.filename,args.averify,result)
+        if args.format!="text" :
+          emit_records(records,args.format,out)
+        else :
+          emit(gen_verifyhuman(records),None,1,out)
+    except (OSError,ValueError) as e :
+      sys.exit( f"{parser.prog}: error: {e}" )
+    if args.mnotes : 
+      print()
+      if args.apack!=None or args.aunpack!=None :
+        help_store()
+      else :
+        help_integrity()
+    if args.averify!=None and result['damaged']+result['unreadable']+result['missing']>0 :
+      sys.exit( f"{parser.prog}: error: verify found {result['damaged']} damaged, {result['unreadable']} unreadable and {result['missing']} missing images" )
+    return
+
+  # Collection topics work on all images passed, not on one loaded disk
+  if args.tsimilar :
+    if args.arelayout!=None or args.aput!=None :
+      sys.exit( f"{parser.prog}: error: actions need a single image, not topic similar" )
+    if any(vars(args)[v] for v in ('vhex','vbam','vdir','vbasic','vasm','vxref')) :
+      sys.exit( f"{parser.prog}: error: topic similar has dedicated view" )
+    for filename in args.filename :
+      if not os.path.exists(filename):
+        sys.exit(f"{parser.prog}: error: {filename} not found")
+    print( f"showing similar images among {len(args.filename)} path(s) as similar [{mmsg}]", file=msg)
+    print(file=msg)
+    if args.mtech>0 : print( f"{parser.prog}: warning: similar view has no tech levels (ignoring --mtech)\n", file=msg )
+    if args.mblockid : print( f"{parser.prog}: warning: similar view has no blocks (ignoring --mblockid)\n", file=msg )
+    if args.mcont : print( f"{parser.prog}: warning: similar view always compares whole images (ignoring --mcont)\n", file=msg )
+    if args.msave!=None : print( f"{parser.prog}: warning: similar view has no blocks to save (ignoring --msave)\n", file=msg )
+    if args.mwatch!=None : print( f"{parser.prog}: warning: similar view compares a collection (ignoring --mwatch)\n", file=msg )
+    if args.format!="text" :
+      emit_records(gen_similarrecords(args.filename,similarity),args.format,out,args.mlimit,mpage)
+    else :
+      emit(gen_similarhuman(args.filename,similarity,with_header=not args.mheader),args.mlimit,mpage)
+    if args.mnotes : 
+      print()
+      help_similar()
+    return
+  if args.tmem and (len(args.filename)>1 or os.path.isdir(args.filename[0])) :
+    if args.arelayout!=None or args.aput!=None :
+      sys.exit( f"{parser.prog}: error: actions need a single image, not topic mem over a collection" )
+    if any(vars(args)[v] for v in ('vhex','vbam','vdir','vbasic','vasm','vxref')) :
+      sys.exit( f"{parser.prog}: error: topic mem has dedicated view" )
+    for filename in args.filename :
+      if not os.path.exists(filename):
+        sys.exit(f"{parser.prog}: error: {filename} not found")
+    print( f"showing mem of all PRG files in {len(args.filename)} path(s) as mem [{mmsg}]", file=msg)
+    print(file=msg)
+    if args.mtech>0 : print( f"{parser.prog}: warning: mem view has no tech levels (ignoring --mtech)\n", file=msg )
+    if args.mblockid : print( f"{parser.prog}: warning: mem view has no blocks (ignoring --mblockid)\n", file=msg )
+    if args.mcont : print( f"{parser.prog}: warning: mem view always follows whole files (ignoring --mcont)\n", file=msg )
+    if args.msave!=None : print( f"{parser.prog}: warning: mem view has no blocks to save (ignoring --msave)\n", file=msg )
+    if args.mwatch!=None : print( f"{parser.prog}: warning: mem view over a collection is not watched (ignoring --mwatch)\n", file=msg )
+    files= []
+    for filename in image_files(args.filename) :
+      try :
+        set_blocks( read_image(filename)[0] )
+      except (OSError,ValueError) as e :
+        print( f"{parser.prog}: warning: skipped '{filename}': {e}", file=msg )
+        continue
+      files+= mem_files(filename)
+    base= os.path.commonpath( [os.path.dirname(os.path.abspath(f['image'])) for f in files] or ["."] )
+    for f in files : f['image']= os.path.relpath(os.path.abspath(f['image']),base) # shortest unique name
+    if args.format!="text" :
+      emit_records(gen_memrecords(files),args.format,out,args.mlimit,mpage)
+    else :
+      emit(gen_memhuman(files,with_header=not args.mheader),args.mlimit,mpage)
+    if args.mnotes : 
+      print()
+      help_mem()
+    return
+  if len(args.filename)>1 :
+    sys.exit( f"{parser.prog}: error: only topic similar and mem, apack, aunpack, amanifest and averify accept more than one image" )
+  args.filename= args.filename[0]
 
   # Check if filename maps to an existing file of the correct size
   if not os.path.exists(args.filename):
     sys.exit(f"{parser.prog}: error: {args.filename} not found")
   with open(args.filename, mode='rb') as file: 
     content = file.read()
+  errors= {}
+  if content[0:len(G64SIGNATURE)]==G64SIGNATURE :
+    if args.aput!=None :
+      sys.exit( f"{parser.prog}: error: aput is only supported on d64 files, {args.filename} is a G64" )
+    try :
+      (content,errors)= g64_decode(content)
+    except ValueError as e :
+      sys.exit( f"{parser.prog}: error: {args.filename}: {e}" )
+    print( f"{parser.prog}: file '{args.filename}' is a G64 (GCR), decoded to {len(content)//BYTESPERBLOCK} blocks ({len(errors)} with errors)", file=msg)
+  elif content[0:len(D64MSIGNATURE)]==D64MSIGNATURE :
+    if args.aput!=None :
+      sys.exit( f"{parser.prog}: error: aput is only supported on d64 files, {args.filename} is a manifest" )
+    try :
+      content= d64m_decode(content,args.filename)
+    except (OSError,ValueError) as e :
+      sys.exit( f"{parser.prog}: error: {args.filename}: {e}" )
+    print( f"{parser.prog}: file '{args.filename}' is a manifest, read {len(content)//BYTESPERBLOCK} blocks from its store", file=msg)
   if len(content)%BYTESPERBLOCK != 0 :
     sys.exit( f"{parser.prog}: error: {args.filename} has size {len(content)} which is not a multiple of {BYTESPERBLOCK}" )
   if len(content)//BYTESPERBLOCK != BLOCKSPERDISK :
     sys.exit( f"{parser.prog}: error: {args.filename} has {len(content)//BYTESPERBLOCK} blocks, this program is written for disks with {BLOCKSPERDISK} blocks" )
-  print( f"{parser.prog}: file '{args.filename}' has {len(content)//BYTESPERBLOCK} blocks of {BYTESPERBLOCK} bytes")
+  print( f"{parser.prog}: file '{args.filename}' has {len(content)//BYTESPERBLOCK} blocks of {BYTESPERBLOCK} bytes", file=msg)
+  # actions
+  if args.aput!=None :
+    with open(args.filename, mode='r+b') as file, mmap.mmap(file.fileno(),0) as mm :
+      writer= D64Writer(mm)
+      for hostname in args.aput :
+        (fname,ext)= os.path.splitext(os.path.basename(hostname))
+        ftype= {'.seq':'SEQ','.usr':'USR'}.get(ext.lower(),'PRG')
+        try :
+          with open(hostname, mode='rb') as file2 :
+            data= file2.read()
+          if ext.lower()=='.bas' :
+            data= bas2bin(data.decode("utf-8"))
+            if bas2bin(bin2listing(data))!=data : # what the basic view shows must tokenize to the same bytes
+              raise ValueError("tokenized program does not list back to the same program")
+          bixs= writer.put(fname,data,ftype)
+        except (OSError,ValueError) as e :
+          writer.flush() # keep the files added so far
+          sys.exit( f"{parser.prog}: error: aput '{hostname}': {e}" )
+        print( f"{parser.prog}: put '{fname.upper()}' as {ftype} in {len(bixs)} blocks at {'/'.join(map(str,bix2ts(bixs[0])))}={bixs[0]}", file=msg)
+      writer.flush()
+      content= bytes(mm)
   # load file
   for bix in range(len(content)//BYTESPERBLOCK):
     blocks.append( Block(bix,content[bix*BYTESPERBLOCK:(1+bix)*BYTESPERBLOCK] ) )
+  for bix,err in errors.items() :
+    blocks[bix].err= err
+  if len(errors)>0 :
+    print( f"{parser.prog}: warning: blocks with decode errors: {', '.join( f'{bix} ({err})' for bix,err in list(errors.items())[:8] )}{', ...' if len(errors)>8 else ''}", file=msg )
 
   # Determine topic (and block index)
   bix=-1
@@ -967,20 +3525,73 @@ def main() :
     fname= args.tfile
     if fname[0]=='"' and fname[-1]=='"' : fname= fname[1:-1]
     elif fname[0]=="'" and fname[-1]=="'" : fname= fname[1:-1]
-    found= None
-    for entry in get_dir():
-      if entry['fname']==fname : 
-        found=entry
-        break
+    found= next( (entry for entry in iter_dir() if entry.fname==fname), None ) # stops at first match
     if found==None :
       sys.exit( f"{parser.prog}: error: tfile could not find filename '{fname}'" )
-    bix= found['block1']
+    bix= found.block1
+    if bix==None :
+      sys.exit( f"{parser.prog}: error: tfile file '{fname}' has no first block" )
     tmsg= f"{fname} at {bix}"
     topic="file"
   elif args.tdisk:
     bix=-1
     tmsg="(all blocks)"
     topic="disk"
+  elif args.tfrag:
+    bix=-1
+    tmsg="of all files"
+    topic="frag"
+  elif args.tload!=None:
+    bix=-1
+    tmsg="of all files"
+    if args.tload!="" :
+      fname= args.tload
+      if fname[0]=='"' and fname[-1]=='"' : fname= fname[1:-1]
+      elif fname[0]=="'" and fname[-1]=="'" : fname= fname[1:-1]
+      found= next( (entry for entry in iter_dir() if entry.fname==fname), None )
+      if found==None :
+        sys.exit( f"{parser.prog}: error: tload could not find filename '{fname}'" )
+      bix= found.block1
+      if bix==None :
+        sys.exit( f"{parser.prog}: error: tload file '{fname}' has no first block" )
+      tmsg= f"of {fname} at {bix}"
+    topic="load"
+  elif args.tlost!=None:
+    cands= lost_candidates()
+    bix=-1
+    tmsg= f"({len(cands)} candidates)"
+    if args.tlost!=0 :
+      if args.tlost<1 or args.tlost>len(cands) :
+        sys.exit( f"{parser.prog}: error: tlost rank must be 1..{len(cands)}, not {args.tlost}" )
+      cand= cands[args.tlost-1]
+      bix= cand['chain'][0]
+      tmsg= f"rank {args.tlost} '{cand['fname']}' at {bix}"
+    topic="lost"
+  elif args.tmem:
+    bix=-1
+    tmsg="of all PRG files"
+    topic="mem"
+  elif args.tgeos!=None:
+    bix=-1
+    fname= None
+    tmsg= "(all GEOS files)"
+    if args.tgeos!="" :
+      fname= args.tgeos
+      if fname[0]=='"' and fname[-1]=='"' : fname= fname[1:-1]
+      elif fname[0]=="'" and fname[-1]=="'" : fname= fname[1:-1]
+      found= next( (entry for entry in iter_dir() if entry.fname==fname), None )
+      if found==None :
+        sys.exit( f"{parser.prog}: error: tgeos could not find filename '{fname}'" )
+      if found.geostype==0 :
+        sys.exit( f"{parser.prog}: error: tgeos file '{fname}' is not a GEOS file" )
+      tmsg= f"{fname}"
+      if args.mrecord!=None :
+        try :
+          bix= geos_record1(found,args.mrecord)
+        except ValueError as e :
+          sys.exit( f"{parser.prog}: error: mrecord: {e}" )
+        tmsg= f"record {args.mrecord} of {fname} at {bix}"
+    topic="geos"
   else :
     bix=357+1
     tmsg= f"starts at {bix}"
@@ -996,108 +3607,257 @@ def main() :
     view= "dir"
   elif args.vbasic :
     view= "basic"
+  elif args.vasm :
+    view= "asm"
+  elif args.vxref :
+    view= "xref"
   else :
     if   topic=="block" : view= "hex"
     elif topic=="bam"   : view= "bam"
     elif topic=="dir"   : view= "dir"
     elif topic=="file"  : view= "hex" # basic
     elif topic=="disk"  : view= "disk"
+    elif topic=="load"  : view= "load"
+    elif topic=="frag"  : view= "frag"
+    elif topic=="lost"  : view= "lost" if bix==-1 else "hex"
+    elif topic=="geos"  : view= "geos" if bix==-1 else "hex"
+    elif topic=="mem"   : view= "mem"
     else :
       sys.exit( f"{parser.prog}: error: view unexpected error in parsing" )
   if topic=="disk" and view!="disk" :
     sys.exit( f"{parser.prog}: error: topic disk has dedicated view, not {view}" )
-
-  # Determine modifiers
-  mmsg=""
-  mcont=0
-  if args.mtech<0 or args.mtech>2 : 
-    sys.exit( f"{parser.prog}: error: mtech must be 0..2, not {args.mtech}" )
-  mmsg+= f" tech{args.mtech}"
-  if args.mblockid:
-    mmsg+= " blockid"
-  if args.mheader:
-    mmsg+= " header"
-  if args.mnotes:
-    mmsg+= " notes"
-  if args.mcont!=None:
-    if not args.mcont.isdigit() :
-      sys.exit( f"{parser.prog}: error: mcont must be num, not {args.tdir}" )
-    mcont= int(args.mcont)
-    if mcont<0 or mcont>BLOCKSPERDISK : 
-      sys.exit( f"{parser.prog}: error: unexpected value for mcont: {mcont}" )
-    mmsg+= f" cont({mcont})"
-  if args.msave!=None:
-    if os.path.exists(args.msave):
-      sys.exit( f"{parser.prog}: error: msave file {args.msave} already exists" )
-    mmsg+= f" save({args.msave})"
-  if mmsg=="" : 
-    mmsg="no modifiers"
-  else : 
-    mmsg= mmsg[1:] # strip leading space
-  # convenient defaults
-  if args.mcont==None :
-    if args.tblock==None and not args.tbam and args.tdir==None and args.tfile==None and not args.tdisk:
-      mcont=17 # entire dir
-      mmsg+= f" cont({mcont})"
-    if args.tdir==0 : 
-      mcont=17 # entire dir
-      mmsg+= f" cont({mcont})"
-    if args.tfile!=None : 
-      mcont=682 # ensure whole file
-      mmsg+= f" cont({mcont})"
+  if topic=="load" and view!="load" :
+    sys.exit( f"{parser.prog}: error: topic load has dedicated view, not {view}" )
+  if args.mheat and view!="disk" :
+    print( f"{parser.prog}: warning: only the disk view has a heatmap (ignoring --mheat)\n", file=msg )
+  if args.mlines!=None and view!="basic" :
+    print( f"{parser.prog}: warning: only the basic view has lines (ignoring --mlines)\n", file=msg )
+  if topic=="frag" and view!="frag" :
+    sys.exit( f"{parser.prog}: error: topic frag has dedicated view, not {view}" )
+  if topic=="lost" and bix==-1 and view!="lost" :
+    sys.exit( f"{parser.prog}: error: topic lost without rank has dedicated view, not {view}" )
+  if topic=="mem" and view!="mem" :
+    sys.exit( f"{parser.prog}: error: topic mem has dedicated view, not {view}" )
+  if topic=="geos" and bix==-1 and view!="geos" :
+    sys.exit( f"{parser.prog}: error: topic geos without mrecord has dedicated view, not {view}" )
+
+  # actions on the loaded disk
+  if args.arelayout!=None :
+    if os.path.exists(args.arelayout):
+      sys.exit( f"{parser.prog}: error: arelayout file {args.arelayout} already exists" )
+    buf= bytearray(BLOCKSPERDISK*BYTESPERBLOCK)
+    try :
+      for (fname,hash1,hash2) in relayout(buf,proctime) :
+        print( f"{parser.prog}: relayout '{fname}' sha1 {hash1} {'ok' if hash1==hash2 else 'MISMATCH '+hash2}", file=msg )
+        if hash1!=hash2 : 
+          sys.exit( f"{parser.prog}: error: arelayout changed content of '{fname}', not written" )
+    except ValueError as e :
+      sys.exit( f"{parser.prog}: error: arelayout {e}" )
+    with open(args.arelayout, mode='wb') as file: 
+      file.write(buf)
+    print( f"{parser.prog}: relayout written to '{args.arelayout}'", file=msg)
 
   # feedback
-  print( f"showing {topic} {tmsg} as {view} [{mmsg}]")
-  print()
+  print( f"showing {topic} {tmsg} as {view} [{mmsg}]", file=msg)
+  print(file=msg)
   
   # Now run (mtech, mblockid, mheader, mnotes, mcont)
-  if view=="hex" : 
-    if args.mtech>0 : print( f"{parser.prog}: warning: hex view has no tech levels (ignoring --mtech)\n" )
-    blocks[bix].print_hex(with_blockid=not args.mblockid,with_header=not args.mheader,with_nexts=mcont)
-    if args.mnotes : 
-      print()
-      help_hex()
-  elif view=="bam" : 
-    if args.mtech>1 : print( f"{parser.prog}: warning: mtech {args.mtech} is not applicable to bam view\n" )
-    if args.mcont : print( f"{parser.prog}: warning: bam view is always 1 block (ignoring --mcont)\n" )
-    if args.mtech==0 :
-      blocks[bix].print_bamhuman(with_blockid=not args.mblockid,with_header=not args.mheader)
+  def geos_entries() : # GEOS files of the geos view, looked up again on every render (for --mwatch)
+    return [entry for entry in iter_dir() if entry.geostype!=0 and fname in (None,entry.fname)][:1 if fname!=None else None]
+
+  def render(with_notes=True) : # notes only with the first render, not on every --mwatch change
+    if args.format!="text" :
+      if view=="hex" : records= blocks[bix].gen_hexrecords(mcont)
+      elif view=="bam" : records= blocks[bix].gen_bamrecords()
+      elif view=="dir" : records= blocks[bix].gen_dirrecords(mcont,with_deleted=args.mtech>0)
+      elif view=="basic" : records= blocks[bix].gen_basicrecords(mcont,linerange)
+      elif view=="xref" : records= gen_xrefrecords(basic_index(blocks[bix]))
+      elif view=="asm" : records= blocks[bix].gen_asmrecords(mcont,with_illegal=args.mtech>0)
+      elif view=="disk" : records= gen_diskrecords()
+      elif view=="frag" : records= gen_fragrecords(proctime)
+      elif view=="load" : records= gen_loadrecords(iter_dir() if bix==-1 else [entry for entry in iter_dir() if entry.block1==bix],proctime)
+      elif view=="lost" : records= gen_lostrecords(cands)
+      elif view=="mem" : records= gen_memrecords(mem_files())
+      elif view=="geos" : records= gen_geosrecords(geos_entries(),with_records=fname!=None)
+      else : sys.exit( f"{parser.prog}: error: unexpected error running ({view})" )
+      emit_records(records,args.format,out,args.mlimit,mpage)
+    elif view=="hex" : 
+      if args.mtech>0 : print( f"{parser.prog}: warning: hex view has no tech levels (ignoring --mtech)\n", file=msg )
+      emit(blocks[bix].gen_hex(with_blockid=not args.mblockid,with_header=not args.mheader,with_nexts=mcont),args.mlimit,mpage)
+      if args.mnotes and with_notes : 
+        print()
+        help_hex()
+    elif view=="bam" : 
+      if args.mtech>1 : print( f"{parser.prog}: warning: mtech {args.mtech} is not applicable to bam view\n", file=msg )
+      if args.mcont : print( f"{parser.prog}: warning: bam view is always 1 block (ignoring --mcont)\n", file=msg )
+      if args.mtech==0 :
+        blocks[bix].print_bamhuman(with_blockid=not args.mblockid,with_header=not args.mheader)
+      else :
+        blocks[bix].print_bamtech(with_blockid=not args.mblockid,with_header=not args.mheader)
+      if args.mnotes and with_notes : 
+        print()
+        help_bam()
+    elif view=="dir" : 
+      if args.mtech==0 :
+        emit(blocks[bix].gen_dirhuman(with_blockid=not args.mblockid,with_header=not args.mheader,with_nexts=mcont),args.mlimit,mpage)
+      else :
+        emit(blocks[bix].gen_dirtech(with_blockid=not args.mblockid,with_header=not args.mheader,with_nexts=mcont,with_rawdata=args.mtech==2),args.mlimit,mpage)
+      if args.mnotes and with_notes : 
+        print()
+        help_dir()
+    elif view=="basic" : 
+      if args.mtech>1 : print( f"{parser.prog}: warning: mtech {args.mtech} is not applicable to basic view\n", file=msg )
+      if args.mlimit : print( f"{parser.prog}: warning: basic view has no line limit (ignoring --mlimit)\n", file=msg )
+      if linerange==None :
+        blocks[bix].print_filebasic(block1=True,addr=None,prvdata=b"",with_blockid=not args.mblockid,with_header=not args.mheader,with_nexts=mcont,for_human=args.mtech==0)
+      else :
+        # jump to the block of the first line via the line index, instead of rendering all blocks before it
+        span= basic_index(blocks[bix]).blockspan(*linerange)
+        if span==None :
+          print( f"{parser.prog}: warning: no basic lines in {linerange[0]}-{linerange[1]}", file=msg )
+        else :
+          (k,addr,prvdata,nexts)= span
+          block= basic_index(blocks[bix]).chain[k]
+          block.print_filebasic(block1=k==0,addr=addr,prvdata=prvdata,with_blockid=not args.mblockid,with_header=not args.mheader,with_nexts=nexts,for_human=args.mtech==0,linerange=linerange)
+      if args.mnotes and with_notes : 
+        print()
+        help_basic()
+    elif view=="xref" : 
+      if args.mtech>0 : print( f"{parser.prog}: warning: xref view has no tech levels (ignoring --mtech)\n", file=msg )
+      if args.mcont : print( f"{parser.prog}: warning: xref view always follows the whole program (ignoring --mcont)\n", file=msg )
+      emit(gen_xrefhuman(basic_index(blocks[bix]),with_header=not args.mheader),args.mlimit,mpage)
+      if args.mnotes and with_notes : 
+        print()
+        help_xref()
+    elif view=="asm" : 
+      if args.mtech>1 : print( f"{parser.prog}: warning: mtech {args.mtech} is not applicable to asm view\n", file=msg )
+      emit(blocks[bix].gen_asm(with_blockid=not args.mblockid,with_header=not args.mheader,with_nexts=mcont,with_illegal=args.mtech>0),args.mlimit,mpage)
+      if args.mnotes and with_notes : 
+        print()
+        help_asm()
+    elif view=="disk"  : 
+      if args.mtech>0 : print( f"{parser.prog}: warning: disk view is always tech (ignoring --mtech)\n", file=msg )
+      if args.mblockid : print( f"{parser.prog}: warning: disk view has no blocks (ignoring --mblockid)\n", file=msg )
+      if args.mheader : print( f"{parser.prog}: warning: disk view has no headers (ignoring --mheader)\n", file=msg )
+      if args.mcont : print( f"{parser.prog}: warning: disk view has no blocks (ignoring --mcont)\n", file=msg )
+      print_blockmap( stats=block_stats(b"".join(block.data for block in blocks)) if args.mheat else None )
+      if args.mnotes and with_notes : 
+        print()
+        help_disk()
+    elif view=="frag" :
+      if args.mtech>0 : print( f"{parser.prog}: warning: frag view has no tech levels (ignoring --mtech)\n", file=msg )
+      if args.mblockid : print( f"{parser.prog}: warning: frag view has no blocks (ignoring --mblockid)\n", file=msg )
+      if args.mcont : print( f"{parser.prog}: warning: frag view always follows whole files (ignoring --mcont)\n", file=msg )
+      emit(gen_fraghuman(with_header=not args.mheader,proctime=proctime),args.mlimit,mpage)
+      if args.mnotes and with_notes : 
+        print()
+        help_frag()
+    elif view=="load" :
+      if args.mblockid : print( f"{parser.prog}: warning: load view has no blocks (ignoring --mblockid)\n", file=msg )
+      if args.mcont : print( f"{parser.prog}: warning: load view always follows whole files (ignoring --mcont)\n", file=msg )
+      if bix==-1 :
+        if args.mtech>0 : print( f"{parser.prog}: warning: load view of all files has no tech levels (ignoring --mtech)\n", file=msg )
+        emit(gen_loadhuman(iter_dir(),with_header=not args.mheader,proctime=proctime),args.mlimit,mpage)
+      elif args.mtech==0 :
+        emit(gen_loadhuman([entry for entry in iter_dir() if entry.block1==bix],with_header=not args.mheader,proctime=proctime),args.mlimit,mpage)
+      else :
+        emit(gen_loadtech(blocks[bix],with_header=not args.mheader,proctime=proctime),args.mlimit,mpage)
+      if args.mnotes and with_notes : 
+        print()
+        help_load()
+    elif view=="lost" :
+      if args.mtech>0 : print( f"{parser.prog}: warning: lost view has no tech levels (ignoring --mtech)\n", file=msg )
+      if args.mblockid : print( f"{parser.prog}: warning: lost view has no blocks (ignoring --mblockid)\n", file=msg )
+      if args.mcont : print( f"{parser.prog}: warning: lost view always follows whole chains (ignoring --mcont)\n", file=msg )
+      emit(gen_losthuman(cands,with_header=not args.mheader),args.mlimit,mpage)
+      if args.mnotes and with_notes : 
+        print()
+        help_lost()
+    elif view=="mem" :
+      if args.mtech>0 : print( f"{parser.prog}: warning: mem view has no tech levels (ignoring --mtech)\n", file=msg )
+      if args.mblockid : print( f"{parser.prog}: warning: mem view has no blocks (ignoring --mblockid)\n", file=msg )
+      if args.mcont : print( f"{parser.prog}: warning: mem view always follows whole files (ignoring --mcont)\n", file=msg )
+      emit(gen_memhuman(mem_files(),with_header=not args.mheader),args.mlimit,mpage)
+      if args.mnotes and with_notes : 
+        print()
+        help_mem()
+    elif view=="geos" :
+      if args.mtech>0 : print( f"{parser.prog}: warning: geos view has no tech levels (ignoring --mtech)\n", file=msg )
+      if args.mblockid : print( f"{parser.prog}: warning: geos view has no blocks (ignoring --mblockid)\n", file=msg )
+      if args.mcont : print( f"{parser.prog}: warning: geos view always follows whole records (ignoring --mcont)\n", file=msg )
+      emit(gen_geoshuman(geos_entries(),with_header=not args.mheader,with_records=fname!=None),args.mlimit,mpage)
+      if args.mnotes and with_notes : 
+        print()
+        help_geos()
     else :
-      blocks[bix].print_bamtech(with_blockid=not args.mblockid,with_header=not args.mheader)
-    if args.mnotes : 
-      print()
-      help_bam()
-  elif view=="dir" : 
-    if args.mtech==0 :
-      blocks[bix].print_dirhuman(with_blockid=not args.mblockid,with_header=not args.mheader,with_nexts=mcont)
+      sys.exit( f"{parser.prog}: error: unexpected error running ({view})" )
+
+  render()
+
+  if args.msave!=None and view=="lost" :
+    os.makedirs(args.msave)
+    for rank,cand in enumerate(cands,1) :
+      with open(os.path.join(args.msave,lost_hostname(rank,cand)), mode='wb') as file: 
+        file.write( chain2bin( blocks[bix] for bix in cand['chain'] ) )
+    print( f"saved {len(cands)} candidates in '{args.msave}'", file=msg)
+  elif args.msave!=None and view=="geos" :
+    entries= geos_entries()
+    if fname==None :
+      print( f"{parser.prog}: warning: msave needs one GEOS file, pass tgeos filename (ignoring --msave)", file=msg )
+    elif entries[0].block1==None :
+      print( f"{parser.prog}: warning: GEOS file '{fname}' has no first block (ignoring --msave)", file=msg )
     else :
-      blocks[bix].print_dirtech(with_blockid=not args.mblockid,with_header=not args.mheader,with_nexts=mcont,with_rawdata=args.mtech==2)
-    if args.mnotes : 
-      print()
-      help_dir()
-  elif view=="basic" : 
-    if args.mtech>1 : print( f"{parser.prog}: warning: mtech {args.mtech} is not applicable to basic view\n" )
-    blocks[bix].print_filebasic(block1=True,addr=None,prvdata=b"",with_blockid=not args.mblockid,with_header=not args.mheader,with_nexts=mcont,for_human=args.mtech==0)
-    if args.mnotes : 
-      print()
-      help_basic()
-  elif view=="disk"  : 
-    if args.mtech>0 : print( f"{parser.prog}: warning: disk view is always tech (ignoring --mtech)\n" )
-    if args.mblockid : print( f"{parser.prog}: warning: disk view has no blocks (ignoring --mblockid)\n" )
-    if args.mheader : print( f"{parser.prog}: warning: disk view has no headers (ignoring --mheader)\n" )
-    if args.mcont : print( f"{parser.prog}: warning: disk view has no blocks (ignoring --mcont)\n" )
-    print_blockmap()
-    if args.mnotes : 
-      print()
-      help_disk()
-  else :
-    sys.exit( f"{parser.prog}: error: unexpected error running ({view})" )
-
-  if args.msave!=None :
-    bin= blocks[bix].tobin()
+      names= geos_save(entries[0],args.msave)
+      print( f"saved {len(names)} files ({', '.join(names[:4])}{', ...' if len(names)>4 else ''}) in '{args.msave}'", file=msg)
+  elif args.msave!=None :
+    if topic=="lost" :
+      bin= chain2bin( blocks[b] for b in cand['chain'] ) # only the recovered chain, not a live file it runs into
+    else :
+      bin= blocks[bix].tobin()
     with open(args.msave, mode='wb') as file: 
       content = file.write(bin)
-      print( f"saved '{args.msave}'")
+      print( f"saved '{args.msave}'", file=msg)
+
+  # Watch: poll the image and re-render the view when blocks it shows changed
+  if args.mwatch!=None :
+    def shown_blocks() : # blocks shown by a block view (None for views over the whole disk)
+      if view not in ("hex","dir","basic","asm","bam") or bix==None or bix<0 : return None
+      return {block.bix for nexts,block in blocks[bix].chain(0 if view=="bam" else mcont)}
+    watcher= ImageWatcher(args.filename)
+    shown= shown_blocks()
+    try :
+      while True :
+        msg.flush()
+        out.flush()
+        time.sleep(args.mwatch)
+        changed= watcher.poll()
+        if len(changed)==0 : continue
+        if (args.tfile!=None or (args.tload!=None and args.tload!="")) and any(blocks[b].tix==18 for b in changed) :
+          found= next( (entry for entry in iter_dir() if entry.fname==fname), None ) # directory changed, file may have moved
+          if found==None :
+            print( f"{parser.prog}: warning: file '{fname}' is no longer in the directory", file=msg )
+            continue
+          if found.block1==None :
+            print( f"{parser.prog}: warning: file '{fname}' has no first block", file=msg )
+            continue
+          bix= found.block1
+        if shown!=None :
+          newshown= shown_blocks()
+          if newshown==shown and shown.isdisjoint(changed) : continue # this view is not affected
+          shown= newshown
+        print( f"\n{parser.prog}: {len(changed)} blocks changed at {time.strftime('%H:%M:%S')}\n", file=msg )
+        if view=="disk" and args.format!="text" :
+          changedset= set(changed)
+          emit_records( (record for record in gen_diskrecords() if record['block'] in changedset), args.format, out )
+        elif view=="disk" :
+          print_blockmap( {blocks[b].tix for b in changed}, stats=block_stats(b"".join(block.data for block in blocks)) if args.mheat else None ) # only the rows that changed
+        else :
+          if topic=="lost" and bix==-1 : cands= lost_candidates()
+          render(with_notes=False)
+    except KeyboardInterrupt :
+      pass
+    finally :
+      watcher.close()
 
   # BAM at 357
   # DIR at 358
@@ -1111,7 +3871,12 @@ def main() :
 
 
 if __name__ == "__main__":
-  main()
+  try :
+    main()
+  except BrokenPipeError :
+    # Consumer stopped reading (e.g. piped into `head`); silence the final flush of stdout
+    os.dup2(os.open(os.devnull,os.O_WRONLY),sys.__stdout__.fileno())
+    sys.exit(1)
 
 #endregion
 
@@ -0,0 +1,266 @@
+# test_d64viewer.py - round trip tests against testcases/cases.d64: BASIC tokenizer, recovery, and the code
+# that writes, converts or checks images (put, relayout, G64 decoding, block store, integrity manifest)
+# Run with `python -m pytest -q` in this directory
+
+
+import contextlib
+import filecmp
+import functools
+import io
+import operator
+import os
+import pytest
+import d64viewer
+
+
+CASES= os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","testcases","cases.d64")
+NAMES= ["CASES1-7"] + [f"CASE-{num:02}" for num in range(8,14)]
+
+
+# Makes cases.d64 the current disk and returns its content
+def load_cases() :
+  content= d64viewer.read_image(CASES)[0]
+  d64viewer.set_charset("upper")
+  d64viewer.set_blocks(content)
+  return content
+
+
+# Returns the directory entry of file `name` on the current disk
+def find_entry(name) :
+  return next( entry for entry in d64viewer.iter_dir() if entry.fname==name )
+
+
+# Returns the lines print_filebasic prints for the file starting at `block1`, up to the end of the program.
+# Block ids are left out, and so are the slack bytes past the end of the last block: those differ per image.
+def basic_view(block1) :
+  out= io.StringIO()
+  with contextlib.redirect_stdout(out) :
+    block1.print_filebasic(block1=True,addr=None,prvdata=b"",with_blockid=False,with_header=True,with_nexts=len(d64viewer.blocks),for_human=True)
+  lines= out.getvalue().splitlines()
+  end= next( lix for lix,line in enumerate(lines) if line[12:21]=="|      0 " )
+  return lines[:end+1]
+
+
+@pytest.mark.parametrize("name",NAMES)
+def test_roundtrip_bytes(name) :
+  load_cases()
+  prg= d64viewer.blocks[find_entry(name).block1].tobin()
+  assert d64viewer.bas2bin(d64viewer.bin2listing(prg))==prg
+
+
+# These programs have a line whose next line address does not fit in the rest of a block (see BasicLineIter.gotonext)
+@pytest.mark.parametrize("name",["CASES1-7","CASE-10","CASE-11"])
+def test_view_link_split(name) :
+  load_cases()
+  lines= basic_view(d64viewer.blocks[find_entry(name).block1])
+  assert lines[-1][12:21]=="|      0 "
+
+
+@pytest.mark.parametrize("name",NAMES)
+def test_roundtrip_view(name) :
+  content= load_cases()
+  entry= find_entry(name)
+  block1= d64viewer.blocks[entry.block1]
+  expected= basic_view(block1)
+  # write the retokenized program as the only file of a fresh image, and view it from there
+  buf= bytearray(content)
+  d64viewer.d64_format(buf,d64viewer.blocks[d64viewer.TRACKSTART[18]].data)
+  writer= d64viewer.D64Writer(buf)
+  bixs= writer.put_entry(entry.block.data[entry.eix+0x02:entry.eix+0x20],d64viewer.bas2bin(d64viewer.bin2listing(block1.tobin())))
+  writer.flush()
+  d64viewer.set_blocks(bytes(buf))
+  assert basic_view(d64viewer.blocks[bixs[0]])==expected
+
+
+# Returns the slice of block `bix` in image content
+def block_slice(bix) :
+  return slice(bix*d64viewer.BYTESPERBLOCK,(bix+1)*d64viewer.BYTESPERBLOCK)
+
+
+# Returns cases.d64 with every all-zero block filled the way the 1541 formats a sector (4B 01 01 ..)
+def formatted_cases() :
+  content= bytearray(load_cases())
+  for bix in range(len(content)//d64viewer.BYTESPERBLOCK) :
+    if not any(content[block_slice(bix)]) : content[block_slice(bix)]= d64viewer.LOSTFORMATTED
+  return content
+
+
+def test_lost_formatted() :
+  content= formatted_cases()
+  # an orphan chain 31/0 -> 31/1 (last block, 10 bytes), and a lone block with an invalid link
+  (a,b,junk)= (d64viewer.TRACKSTART[31],d64viewer.TRACKSTART[31]+1,d64viewer.TRACKSTART[32])
+  content[block_slice(a)]= bytes((31,1,0x01,0x08)) + bytes(range(252))
+  content[block_slice(b)]= bytes((0,11)) + bytes(254)
+  content[block_slice(junk)]= bytes((99,99)) + bytes(range(254))
+  d64viewer.set_blocks(bytes(content))
+  cands= d64viewer.lost_candidates()
+  assert [(cand['chain'],cand['end']) for cand in cands]==[([a,b],"ok")]
+
+
+# Returns cases.d64 formatted (keeping its BAM header), ready for a D64Writer
+def formatted_image() :
+  load_cases()
+  buf= bytearray(d64viewer.BLOCKSPERDISK*d64viewer.BYTESPERBLOCK)
+  d64viewer.d64_format(buf,d64viewer.blocks[d64viewer.TRACKSTART[18]].data)
+  return buf
+
+
+def test_put_readback() :
+  buf= formatted_image()
+  data= bytes((0x01,0x08)) + bytes( (7*i)&0xFF for i in range(600) )
+  writer= d64viewer.D64Writer(buf)
+  nfree= writer.nfree
+  bixs= writer.put("hello",data)
+  writer.flush()
+  # BAM: the blocks of the file are no longer free, all others still are
+  assert len(bixs)==3 and d64viewer.D64Writer(buf).nfree==nfree-3
+  bam= d64viewer.TRACKSTART[18]*d64viewer.BYTESPERBLOCK
+  for bix in bixs :
+    (tix,six)= d64viewer.bix2ts(bix)
+    assert not buf[bam+4*tix+1+six//8] & (1<<six%8)
+  # directory and chain
+  d64viewer.set_blocks(bytes(buf))
+  entry= find_entry("HELLO")
+  assert (entry.ftype,entry.size,entry.block1)==("PRG",3,bixs[0])
+  assert [block.bix for nexts,block in d64viewer.blocks[entry.block1].chain()]==bixs
+  assert d64viewer.blocks[entry.block1].tobin()==data
+
+
+def test_put_disk_full() :
+  buf= formatted_image()
+  writer= d64viewer.D64Writer(buf)
+  for num in range(16) : writer.put(f"small{num}",b"\x01\x08small") # fills 2 directory blocks, the next file needs a third
+  writer.flush()
+  before= bytes(buf)
+  with pytest.raises(ValueError,match="disk full") :
+    writer.put("big",bytes(200000))
+  writer.flush()
+  assert bytes(buf)==before # no directory block or BAM bit taken
+
+
+# Returns the content of every file on the current disk, by name
+def file_contents() :
+  return { entry.fname:d64viewer.blocks[entry.block1].tobin() for entry in d64viewer.iter_dir() }
+
+
+def test_relayout() :
+  load_cases()
+  expected= file_contents()
+  buf= bytearray(d64viewer.BLOCKSPERDISK*d64viewer.BYTESPERBLOCK)
+  hashes= list(d64viewer.relayout(buf))
+  assert [fname for fname,hash1,hash2 in hashes]==NAMES
+  assert all( hash1==hash2 for fname,hash1,hash2 in hashes )
+  d64viewer.set_blocks(bytes(buf))
+  assert file_contents()==expected
+
+
+# Returns a formatted image with GEOS VLIR file 'GEOTEST': record 0 (3 blocks), record 1 empty, record 2 (1 block), and an info block
+def geos_image() :
+  buf= formatted_image()
+  writer= d64viewer.D64Writer(buf)
+  records= [ writer.write_chain(bytes(range(256))*2), writer.write_chain(b"record 2") ]
+  info= writer.write_chain(bytes(d64viewer.BYTESPERBLOCK-2))
+  index= bytes(d64viewer.bix2ts(records[0][0])) + bytes((0x00,0xFF)) + bytes(d64viewer.bix2ts(records[1][0]))
+  # type USR, t/s (filled in), name, info t/s, VLIR, application, date, size (filled in)
+  entry= bytes((0x83,0,0)) + b"GEOTEST".ljust(16,b"\xA0") + bytes(d64viewer.bix2ts(info[0])) + bytes((0x01,0x06,94,5,17,12,30,0,0))
+  writer.put_entry(entry,index,nextra=5)
+  writer.flush()
+  return buf
+
+
+# Returns (size,info block,content per record) of GEOS VLIR file `name` on the current disk
+def geos_contents(name) :
+  entry= find_entry(name)
+  info= d64viewer.blocks[d64viewer.geos_info(entry)['block']].data
+  records= [ None if chain==None else d64viewer.chain2bin(d64viewer.blocks[bix] for bix in chain) for chain in d64viewer.geos_records(d64viewer.blocks[entry.block1]) ]
+  return (entry.size,info,records)
+
+
+def test_relayout_geos() :
+  d64viewer.set_blocks(bytes(geos_image()))
+  expected= geos_contents("GEOTEST")
+  assert expected[0]==6 and [record!=None for record in expected[2]]==[True,False,True]
+  buf= bytearray(d64viewer.BLOCKSPERDISK*d64viewer.BYTESPERBLOCK)
+  assert all( hash1==hash2 for fname,hash1,hash2 in d64viewer.relayout(buf) )
+  d64viewer.set_blocks(bytes(buf))
+  assert geos_contents("GEOTEST")==expected
+
+
+# Returns the GCR bits (str) of `data`
+def gcr_encode(data) :
+  return "".join( format(d64viewer.GCRENCODE[b>>4],"05b")+format(d64viewer.GCRENCODE[b&0x0F],"05b") for b in data )
+
+
+# Returns d64 `content` as a G64 (one track per full track, no half tracks); the data checksum of block `badbix` is wrong
+def g64_encode(content,badbix=None) :
+  tracks= []
+  for tix in range(1,len(d64viewer.SECTORSPERTRACK)-1) :
+    bits= ""
+    for six in range(d64viewer.SECTORSPERTRACK[tix]) :
+      bix= d64viewer.TRACKSTART[tix]+six
+      data= content[block_slice(bix)]
+      checksum= functools.reduce(operator.xor,data,0) ^ (bix==badbix)
+      header= bytes((0x08,six^tix^0x31^0x37,six,tix,0x37,0x31,0x0F,0x0F))
+      bits+= "1"*40 + gcr_encode(header) + "01010101"*9 + "1"*40 + gcr_encode(bytes((0x07,))+data+bytes((checksum,0,0))) + "01010101"*8
+    bits+= "0"*(-len(bits)%8)
+    tracks.append( int(bits,2).to_bytes(len(bits)//8,'big') )
+  numhalftracks= 84
+  header= d64viewer.G64SIGNATURE + bytes((0,numhalftracks)) + (7928).to_bytes(2,'little')
+  (offsets,body)= ([0]*numhalftracks,b"")
+  for tix,track in enumerate(tracks) :
+    offsets[2*tix]= len(header)+8*numhalftracks+len(body)
+    body+= len(track).to_bytes(2,'little') + track
+  return header + b"".join( offset.to_bytes(4,'little') for offset in offsets ) + bytes(4*numhalftracks) + body
+
+
+def test_g64_decode(tmp_path) :
+  content= load_cases()
+  badbix= d64viewer.TRACKSTART[17]+4
+  (tmp_path/"cases.g64").write_bytes( g64_encode(content,badbix) )
+  (decoded,errors)= d64viewer.read_image(str(tmp_path/"cases.g64"))
+  assert decoded==content
+  assert errors=={badbix:"data checksum error"}
+
+
+# Writes cases.d64 as images/a.d64, and as images/sub/b.d64 with one byte changed in block `bix`; returns the images directory
+def write_images(tmp_path,bix) :
+  content= load_cases()
+  (tmp_path/"images"/"sub").mkdir(parents=True)
+  (tmp_path/"images"/"a.d64").write_bytes(content)
+  changed= bytearray(content)
+  changed[bix*d64viewer.BYTESPERBLOCK+0x10]^= 0xFF
+  (tmp_path/"images"/"sub"/"b.d64").write_bytes(changed)
+  return tmp_path/"images"
+
+
+def test_pack_unpack(tmp_path) :
+  images= write_images(tmp_path,d64viewer.TRACKSTART[17])
+  list( d64viewer.gen_pack([str(images)],str(tmp_path/"store")) )
+  # every distinct block once: the second image adds only its changed block
+  content= (images/"a.d64").read_bytes()
+  ndistinct= len({ content[block_slice(bix)] for bix in range(d64viewer.BLOCKSPERDISK) })
+  assert os.path.getsize(tmp_path/"store"/d64viewer.STOREDATA)==(ndistinct+1)*d64viewer.BYTESPERBLOCK
+  list( d64viewer.gen_unpack([str(tmp_path/"store")],str(tmp_path/"out")) )
+  for name in ("a.d64",os.path.join("sub","b.d64")) :
+    assert filecmp.cmp(images/name,tmp_path/"out"/name,shallow=False)
+
+
+def test_manifest_verify(tmp_path) :
+  images= write_images(tmp_path,d64viewer.TRACKSTART[17]) # b.d64 differs, but is taken as it is into the manifest
+  manifest= str(tmp_path/"manifest.json")
+  list( d64viewer.gen_manifest([str(images)],manifest) )
+  result= {}
+  list( d64viewer.gen_verifyrecords([str(images)],manifest,result) )
+  assert result=={"ok":2,"damaged":0,"unreadable":0,"new":0,"missing":0}
+  # damage one byte of a block of CASE-08 in a.d64
+  bix= find_entry("CASE-08").block1
+  content= bytearray((images/"a.d64").read_bytes())
+  content[bix*d64viewer.BYTESPERBLOCK+0x80]^= 0x01
+  (images/"a.d64").write_bytes(content)
+  result= {}
+  records= list( d64viewer.gen_verifyrecords([str(images)],manifest,result) )
+  assert result=={"ok":1,"damaged":1,"unreadable":0,"new":0,"missing":0}
+  damaged= [ record for record in records if record['record']=="verify" and record['status']=="damaged" ]
+  assert [record['image'] for record in damaged]==[str(images/"a.d64")]
+  (tix,six)= d64viewer.bix2ts(bix)
+  assert damaged[0]['blocks']==[{'block':bix, 'track':tix, 'sector':six, 'owner':"'CASE-08'"}]